@@ -1,5 +1,15 @@
 from .chess_game import play_chess
-from .chess_gui import play_chess_gui
 
 __version__ = '0.9.0'
-__all__ = ['play_chess_gui', 'play_chess']
\ No newline at end of file
+__all__ = ['play_chess_gui', 'play_chess']
+
+
+def __getattr__(name):
+    # The GUI needs tkinter and Pillow, so it is only imported when asked for
+    if name == 'play_chess_gui':
+        from .chess_gui import play_chess_gui
+        return play_chess_gui
+    if name == 'chess_gui':
+        from . import chess_gui
+        return chess_gui
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
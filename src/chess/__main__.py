@@ -1,4 +1,41 @@
-from .chess_gui import play_chess_gui
+import argparse
+
+from .chess_game import play_chess
 
 if __name__ == '__main__':
-    play_chess_gui()
+    parser = argparse.ArgumentParser(prog='python -m chess', description='Play chess.')
+    parser.add_argument('--terminal', action='store_true', help='play in the terminal instead of the window')
+    parser.add_argument('--engine', choices=['white', 'black'], help='let the computer play this color')
+    parser.add_argument('--movetime', type=float, default=2, help='seconds the computer thinks per move (default: 2)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes the computer searches with (default: 1)')
+    parser.add_argument('--journal', help='append every move to this file as it is played, '
+                                          'resuming the game already in it')
+    parser.add_argument('--book', help='Polyglot opening book (.bin) the computer plays its first moves from')
+    parser.add_argument('--book-best', action='store_true',
+                        help='always play the most played book move instead of a weighted random one')
+    parser.add_argument('--first-frame', action='store_true',
+                        help='close the window as soon as it is drawn, to time the startup')
+    args = parser.parse_args()
+
+    engine = None
+    book = None
+    if args.engine and args.book:
+        from .book import OpeningBook
+        book = OpeningBook(args.book)
+    if args.engine and args.workers > 1:
+        from .smp import ParallelEngine
+        engine = ParallelEngine(args.workers, max_time=args.movetime, book=book, book_best=args.book_best)
+    elif args.engine:
+        from .engine import Engine
+        engine = Engine(max_time=args.movetime, book=book, book_best=args.book_best)
+    try:
+        if args.terminal:
+            play_chess(args.engine, engine, args.journal)
+        else:
+            from .chess_gui import play_chess_gui
+            play_chess_gui(args.engine, engine, args.journal, first_frame=args.first_frame)
+    finally:
+        # The parallel engine keeps its table in shared memory until closed
+        if hasattr(engine, 'close'):
+            engine.close()
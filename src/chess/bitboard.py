@@ -0,0 +1,485 @@
+from .chess_game import ChessBoard, Move, MoveCache, PROMOTIONS, PAWN_ROWS, CASTLING_MASKS
+from .evaluation import SEE_VALUES
+
+__all__ = ['BitboardChessBoard', 'knight_attacks', 'king_attacks', 'pawn_attacks',
+           'bishop_attacks', 'rook_attacks', 'queen_attacks']
+
+# Squares are numbered row * 8 + col, with row 0 being the black back rank,
+# so a bitboard is a Python int where bit `sq` is set when the square is occupied
+PIECE_INDEX = {'P': 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5}
+
+# Row of the en passant square a pawn of each color can capture on
+EN_PASSANT_ROWS = {'white': 2, 'black': 5}
+
+# (row, col) of every square, looked up instead of divmod in the move loops
+SQUARES = [divmod(sq, 8) for sq in range(64)]
+
+# The first and last rows, where a pawn arriving promotes
+PROMOTION_SQUARES = (0xFF << 56) | 0xFF
+
+
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        x, y = divmod(sq, 8)
+        bb = 0
+        for dx, dy in offsets:
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                bb |= 1 << ((x + dx) * 8 + y + dy)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table([(2, 1), (2, -1), (-2, 1), (-2, -1),
+                                (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _leaper_table([(1, 0), (-1, 0), (0, 1), (0, -1),
+                              (1, 1), (1, -1), (-1, 1), (-1, -1)])
+PAWN_ATTACKS = {
+    'white': _leaper_table([(-1, -1), (-1, 1)]),
+    'black': _leaper_table([(1, -1), (1, 1)]),
+}
+
+
+def _ray(sq, dx, dy, occupied):
+    # Walk from sq until the edge of the board or the first occupied square
+    x, y = divmod(sq, 8)
+    bb = 0
+    while True:
+        x, y = x + dx, y + dy
+        if not (0 <= x < 8 and 0 <= y < 8):
+            return bb
+        bb |= 1 << (x * 8 + y)
+        if occupied & (1 << (x * 8 + y)):
+            return bb
+
+
+def _line_tables(directions):
+    # For every square, the relevant occupancy mask of the line (edges excluded, as
+    # with magic bitboards) and a lookup of the attack set for every blocker subset.
+    # The dict plays the role of the magic multiplication: a perfect hash from the
+    # masked occupancy to the precomputed attacks.
+    masks = []
+    attacks = []
+    for sq in range(64):
+        mask = 0
+        for dx, dy in directions:
+            x, y = divmod(sq, 8)
+            while 0 <= x + 2 * dx < 8 and 0 <= y + 2 * dy < 8:
+                x, y = x + dx, y + dy
+                mask |= 1 << (x * 8 + y)
+        lookup = {}
+        subset = 0
+        while True:
+            bb = 0
+            for dx, dy in directions:
+                bb |= _ray(sq, dx, dy, subset)
+            lookup[subset] = bb
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        attacks.append(lookup)
+    return masks, attacks
+
+
+RANK_MASKS, RANK_ATTACKS = _line_tables([(0, 1), (0, -1)])
+FILE_MASKS, FILE_ATTACKS = _line_tables([(1, 0), (-1, 0)])
+DIAGONAL_MASKS, DIAGONAL_ATTACKS = _line_tables([(1, 1), (-1, -1)])
+ANTI_DIAGONAL_MASKS, ANTI_DIAGONAL_ATTACKS = _line_tables([(1, -1), (-1, 1)])
+
+
+def _between_table():
+    # Squares strictly between two squares on a common line, or 0 when they are not aligned
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
+            x, y = divmod(sq, 8)
+            between = 0
+            while 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                x, y = x + dx, y + dy
+                table[sq][x * 8 + y] = between
+                between |= 1 << (x * 8 + y)
+    return table
+
+
+BETWEEN = _between_table()
+
+
+def knight_attacks(sq):
+    return KNIGHT_ATTACKS[sq]
+
+
+def king_attacks(sq):
+    return KING_ATTACKS[sq]
+
+
+def pawn_attacks(sq, color):
+    return PAWN_ATTACKS[color][sq]
+
+
+def bishop_attacks(sq, occupied):
+    return (DIAGONAL_ATTACKS[sq][occupied & DIAGONAL_MASKS[sq]] |
+            ANTI_DIAGONAL_ATTACKS[sq][occupied & ANTI_DIAGONAL_MASKS[sq]])
+
+
+def rook_attacks(sq, occupied):
+    return (RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]] |
+            FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]])
+
+
+def queen_attacks(sq, occupied):
+    return bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)
+
+
+def squares(bb):
+    """Yield the (row, col) of every square set in a bitboard"""
+    while bb:
+        low = bb & -bb
+        yield SQUARES[low.bit_length() - 1]
+        bb ^= low
+
+
+class BitboardChessBoard(ChessBoard):
+    """ChessBoard that keeps one bitboard per piece type and color in sync with the
+    8x8 board and uses them for move generation and attack detection.
+
+    The `board` list stays the source of truth for the pieces, so the terminal and
+    the GUI work unchanged, but it must only be modified through the move methods.
+    """
+
+    # A cache of its own, it generates the moves of a position in another order
+    move_cache = MoveCache()
+
+    def setup_board(self):
+        super().setup_board()
+        self.load_bitboards()
+
+    def load_bitboards(self):
+        """Rebuild the bitboards from the 8x8 board"""
+        self.pieces_bb = {'white': [0] * 6, 'black': [0] * 6}
+        self.color_bb = {'white': 0, 'black': 0}
+        for i in range(8):
+            for j in range(8):
+                piece = self.board[i][j]
+                if piece:
+                    self._toggle(piece, i * 8 + j)
+
+    def _toggle(self, piece, sq):
+        bit = 1 << sq
+        self.pieces_bb[piece.color][PIECE_INDEX[piece.symbol]] ^= bit
+        self.color_bb[piece.color] ^= bit
+
+    def _apply(self, record):
+        # Toggle the squares changed by an undo record, which undoes itself when applied twice
+        start, end, piece, _, captured, captured_pos, rook_move = record[:7]
+        promoted = record[9]
+        pieces_bb = self.pieces_bb[piece.color]
+        start_bit = 1 << (start[0] * 8 + start[1])
+        end_bit = 1 << (end[0] * 8 + end[1])
+        if promoted is None:
+            pieces_bb[PIECE_INDEX[piece.symbol]] ^= start_bit | end_bit
+        else:
+            pieces_bb[0] ^= start_bit
+            pieces_bb[PIECE_INDEX[promoted.symbol]] ^= end_bit
+        self.color_bb[piece.color] ^= start_bit | end_bit
+        if captured is not None:
+            self._toggle(captured, captured_pos[0] * 8 + captured_pos[1])
+        if rook_move is not None:
+            (rook_x, rook_y), (rook_end_x, rook_end_y) = rook_move
+            mask = (1 << (rook_x * 8 + rook_y)) | (1 << (rook_end_x * 8 + rook_end_y))
+            pieces_bb[3] ^= mask
+            self.color_bb[piece.color] ^= mask
+
+    def make_move(self, start, end, check_rules=True, promotion=None):
+        if not super().make_move(start, end, check_rules, promotion):
+            return False
+        self._apply(self.undo_stack[-1])
+        return True
+
+    def pop(self):
+        record = self.undo_stack[-1]
+        move = super().pop()
+        self._apply(record)
+        return move
+
+    @property
+    def occupied(self):
+        return self.color_bb['white'] | self.color_bb['black']
+
+    def get_king_position(self, color):
+        king = self.pieces_bb[color][5]
+        if not king:
+            return None
+        return divmod(king.bit_length() - 1, 8)
+
+    def _attacked(self, sq, color, occupied):
+        enemy = self.pieces_bb['black' if color == 'white' else 'white']
+        return bool(KNIGHT_ATTACKS[sq] & enemy[1] or
+                    PAWN_ATTACKS[color][sq] & enemy[0] or
+                    KING_ATTACKS[sq] & enemy[5] or
+                    bishop_attacks(sq, occupied) & (enemy[2] | enemy[4]) or
+                    rook_attacks(sq, occupied) & (enemy[3] | enemy[4]))
+
+    def is_square_under_attack(self, pos, color):
+        return self._attacked(pos[0] * 8 + pos[1], color, self.occupied)
+
+    def would_be_in_check(self, start, end, color):
+        # Test the king against the occupancy the move would leave, without making it
+        from_sq = start[0] * 8 + start[1]
+        to_sq = end[0] * 8 + end[1]
+        piece = self.board[start[0]][start[1]]
+        enemy = self.pieces_bb['black' if color == 'white' else 'white']
+        remaining = ~(1 << to_sq)
+        occupied = (self.occupied & ~(1 << from_sq)) | (1 << to_sq)
+        if piece.symbol == 'P' and start[1] != end[1] and self.board[end[0]][end[1]] is None:
+            # En passant removes the pawn beside the start square
+            captured = 1 << (start[0] * 8 + end[1])
+            remaining &= ~captured
+            occupied &= ~captured
+        if piece.symbol == 'K':
+            sq = to_sq
+        else:
+            king = self.pieces_bb[color][5]
+            if not king:
+                return False
+            sq = king.bit_length() - 1
+        return bool(KNIGHT_ATTACKS[sq] & enemy[1] & remaining or
+                    PAWN_ATTACKS[color][sq] & enemy[0] & remaining or
+                    KING_ATTACKS[sq] & enemy[5] or
+                    bishop_attacks(sq, occupied) & (enemy[2] | enemy[4]) & remaining or
+                    rook_attacks(sq, occupied) & (enemy[3] | enemy[4]) & remaining)
+
+    def attackers_mask(self, pos, color):
+        """Return a bitboard of the enemy pieces of color that attack pos"""
+        sq = pos[0] * 8 + pos[1]
+        enemy = self.pieces_bb['black' if color == 'white' else 'white']
+        occupied = self.occupied
+        return (KNIGHT_ATTACKS[sq] & enemy[1] |
+                PAWN_ATTACKS[color][sq] & enemy[0] |
+                KING_ATTACKS[sq] & enemy[5] |
+                bishop_attacks(sq, occupied) & (enemy[2] | enemy[4]) |
+                rook_attacks(sq, occupied) & (enemy[3] | enemy[4]))
+
+    def iter_attackers(self, pos, color):
+        return squares(self.attackers_mask(pos, color))
+
+    def see(self, start, end):
+        # Same exchange as ChessBoard.see, with the captures taken off an occupancy mask
+        sq = end[0] * 8 + end[1]
+        piece = self.board[start[0]][start[1]]
+        victim = self.board[end[0]][end[1]]
+        occupied = self.occupied & ~(1 << (start[0] * 8 + start[1]))
+        if victim is None and piece.symbol == 'P' and start[1] != end[1]:
+            victim = self.board[start[0]][end[1]]
+            occupied &= ~(1 << (start[0] * 8 + end[1]))
+        gains = [SEE_VALUES[victim.symbol] if victim else 0]
+        value = SEE_VALUES[piece.symbol]
+        color = 'black' if piece.color == 'white' else 'white'
+        white, black = self.pieces_bb['white'], self.pieces_bb['black']
+        bishops = white[2] | white[4] | black[2] | black[4]
+        rooks = white[3] | white[4] | black[3] | black[4]
+        while True:
+            # Attackers of both colors through the remaining occupancy
+            attackers = (KNIGHT_ATTACKS[sq] & (white[1] | black[1]) |
+                         KING_ATTACKS[sq] & (white[5] | black[5]) |
+                         PAWN_ATTACKS['black'][sq] & white[0] |
+                         PAWN_ATTACKS['white'][sq] & black[0] |
+                         bishop_attacks(sq, occupied) & bishops |
+                         rook_attacks(sq, occupied) & rooks) & occupied
+            own = attackers & self.color_bb[color]
+            if not own:
+                break
+            for index, symbol in enumerate('PNBRQK'):
+                bb = own & self.pieces_bb[color][index]
+                if bb:
+                    break
+            gains.append(value - gains[-1])
+            occupied &= ~(bb & -bb)
+            value = SEE_VALUES[symbol]
+            color = 'black' if color == 'white' else 'white'
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = -max(-gains[-1], gain)
+        return gains[0]
+
+    def king_exposed(self, start, end, color):
+        return self.would_be_in_check(start, end, color)
+
+    def piece_moves(self, pos, check_king_safety=True):
+        if check_king_safety:
+            return super().piece_moves(pos)
+        piece = self.board[pos[0]][pos[1]]
+        if piece is None:
+            return []
+        return list(squares(self._targets(piece, pos[0] * 8 + pos[1])))
+
+    def _targets(self, piece, sq):
+        # Bitboard of the pseudo-legal destinations of a piece, castling excluded
+        own = self.color_bb[piece.color]
+        enemy = self.color_bb['black' if piece.color == 'white' else 'white']
+        occupied = own | enemy
+        symbol = piece.symbol
+
+        if symbol == 'P':
+            step = -8 if piece.color == 'white' else 8
+            targets = PAWN_ATTACKS[piece.color][sq] & enemy
+            one = sq + step
+            if 0 <= one < 64 and not occupied & (1 << one):
+                targets |= 1 << one
+                two = one + step
+                if sq >> 3 == PAWN_ROWS[piece.color] and not occupied & (1 << two):
+                    targets |= 1 << two
+            if self.en_passant_square is not None:
+                ep_x, ep_y = self.en_passant_square
+                if ep_x == EN_PASSANT_ROWS[piece.color]:
+                    targets |= PAWN_ATTACKS[piece.color][sq] & (1 << (ep_x * 8 + ep_y))
+            return targets
+        if symbol == 'N':
+            return KNIGHT_ATTACKS[sq] & ~own
+        if symbol == 'B':
+            return bishop_attacks(sq, occupied) & ~own
+        if symbol == 'R':
+            return rook_attacks(sq, occupied) & ~own
+        if symbol == 'Q':
+            return queen_attacks(sq, occupied) & ~own
+        return KING_ATTACKS[sq] & ~own
+
+    def pinned_pieces(self, color):
+        pins = self._pins(color)
+        if not pins:
+            return {}
+        king_x, king_y = self.get_king_position(color)
+        pinned = {}
+        for sq in pins:
+            x, y = divmod(sq, 8)
+            pinned[(x, y)] = ((x > king_x) - (x < king_x), (y > king_y) - (y < king_y))
+        return pinned
+
+    def _pins(self, color):
+        # Map each pinned square to the line it may move along: the squares up to and including the pinner
+        enemy = self.pieces_bb['black' if color == 'white' else 'white']
+        own = self.color_bb[color]
+        king = self.pieces_bb[color][5]
+        if not king:
+            return {}
+        king_sq = king.bit_length() - 1
+        # Look through our own pieces to find the enemy sliders lined up with the king
+        them = self.color_bb['black' if color == 'white' else 'white']
+        snipers = (rook_attacks(king_sq, them) & (enemy[3] | enemy[4]) |
+                   bishop_attacks(king_sq, them) & (enemy[2] | enemy[4]))
+        pins = {}
+        while snipers:
+            low = snipers & -snipers
+            snipers ^= low
+            sniper_sq = low.bit_length() - 1
+            between = BETWEEN[king_sq][sniper_sq]
+            blockers = between & own
+            if blockers and not blockers & (blockers - 1) and not between & them:
+                pins[blockers.bit_length() - 1] = between | low
+        return pins
+
+    def move_targets(self, color, pos=None):
+        """Yield (square, piece, targets) for the legal moves of color, the destinations of
+        the piece on square as a bitboard; only those of the piece at pos if given.
+
+        Castling and en passant come as targets of their own, in the order legal_moves yields them."""
+        king = self.pieces_bb[color][5]
+        if not king:
+            return
+        king_sq = king.bit_length() - 1
+        king_pos = SQUARES[king_sq]
+        board = self.board
+        own = self.color_bb[color]
+        checkers = self.attackers_mask(king_pos, color)
+
+        # King moves, tested against the occupancy without the king so it cannot hide behind itself
+        if pos is None or pos == king_pos:
+            piece = board[king_pos[0]][king_pos[1]]
+            steps = KING_ATTACKS[king_sq] & ~own
+            occupied = self.occupied ^ king
+            targets = 0
+            while steps:
+                low = steps & -steps
+                steps ^= low
+                if not self._attacked(low.bit_length() - 1, color, occupied):
+                    targets |= low
+            yield king_sq, piece, targets
+            if not checkers and self.castling & CASTLING_MASKS[color]:
+                if piece.can_castle_kingside(self):
+                    yield king_sq, piece, king << 2
+                if piece.can_castle_queenside(self):
+                    yield king_sq, piece, king >> 2
+
+        # In double check only the king can move
+        if checkers & (checkers - 1):
+            return
+        evasions = -1
+        if checkers:
+            evasions = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+        pins = self._pins(color)
+        en_passant = -1
+        if self.en_passant_square is not None and self.en_passant_square[0] == EN_PASSANT_ROWS[color]:
+            ep_x, ep_y = self.en_passant_square
+            en_passant = ep_x * 8 + ep_y
+
+        pieces = own & ~king
+        if pos is not None:
+            pieces &= 1 << (pos[0] * 8 + pos[1])
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            sq = low.bit_length() - 1
+            start = SQUARES[sq]
+            piece = board[start[0]][start[1]]
+            targets = self._targets(piece, sq)
+            if sq in pins:
+                targets &= pins[sq]
+            if en_passant >= 0 and targets & (1 << en_passant) and piece.symbol == 'P':
+                # En passant removes two pieces from the king's lines, test it separately
+                targets &= ~(1 << en_passant)
+                end = SQUARES[en_passant]
+                captured = 1 << (start[0] * 8 + end[1])
+                if (evasions & (1 << en_passant) or checkers & captured) and \
+                        not self.would_be_in_check(start, end, color):
+                    yield sq, piece, 1 << en_passant
+            yield sq, piece, targets & evasions
+
+    def legal_moves(self, color=None, pos=None):
+        if color is None:
+            color = self.current_player
+        for sq, piece, targets in self.move_targets(color, pos):
+            start = SQUARES[sq]
+            promotes = piece.symbol == 'P' and targets & PROMOTION_SQUARES
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                end = SQUARES[low.bit_length() - 1]
+                if promotes:
+                    for promotion in PROMOTIONS:
+                        yield Move(start, end, promotion)
+                else:
+                    yield Move(start, end)
+
+    def count_legal_moves(self, color=None):
+        # Count the target sets instead of making a move of every square in them
+        if color is None:
+            color = self.current_player
+        count = 0
+        for _, piece, targets in self.move_targets(color):
+            # popcount inlined, this loop runs at every leaf of perft
+            count += bin(targets).count('1')
+            if piece.symbol == 'P' and targets & PROMOTION_SQUARES:
+                count += 3 * bin(targets & PROMOTION_SQUARES).count('1')
+        return count
+
+    @classmethod
+    def from_dict(cls, data):
+        board = super().from_dict(data)
+        board.load_bitboards()
+        return board
+
+    @classmethod
+    def from_fen(cls, fen):
+        board = super().from_fen(fen)
+        board.load_bitboards()
+        return board
@@ -0,0 +1,117 @@
+import mmap
+import random
+import struct
+
+from .chess_game import Move
+
+__all__ = ['OpeningBook', 'BookEntry']
+
+# Polyglot entries are 16 big-endian bytes sorted by key: key, move, weight and learn data
+ENTRY = struct.Struct('>QHHI')
+
+# Promotion pieces by the number Polyglot stores for them
+POLYGLOT_PROMOTIONS = {1: 'N', 2: 'B', 3: 'R', 4: 'Q'}
+
+
+class BookEntry:
+    def __init__(self, move, weight, learn=0):
+        self.move = move
+        self.weight = weight
+        self.learn = learn
+
+    def __repr__(self):
+        return f"BookEntry({self.move}, weight={self.weight})"
+
+
+class OpeningBook:
+    """Polyglot (.bin) opening book.
+
+    The file is memory mapped and searched in place, so opening even a large book
+    costs nothing and processes using the same book share it through the page cache.
+    """
+
+    def __init__(self, path, rng=None):
+        self.path = path
+        self.random = rng or random.Random()
+        with open(path, 'rb') as file:
+            size = file.seek(0, 2)
+            # An empty file cannot be mapped
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.size = size // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def key_at(self, index):
+        return ENTRY.unpack_from(self.data, index * ENTRY.size)[0]
+
+    def entries(self, board):
+        """Return the BookEntry objects for the position, keeping only moves that are legal in it"""
+        key = board.zobrist_key
+        # Binary search for the first entry with the key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        legal = None
+        entries = []
+        for index in range(low, self.size):
+            entry_key, move, weight, learn = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            if legal is None:
+                legal = set(board.cached_legal_moves())
+            move = self.decode(board, move)
+            if move in legal:
+                entries.append(BookEntry(move, weight, learn))
+        return entries
+
+    def choose(self, board, best=False):
+        """Return a book move for the position, or None when it is not in the book.
+
+        Moves are picked at random in proportion to their weights, or the heaviest one with best.
+        """
+        entries = [entry for entry in self.entries(board) if entry.weight or best]
+        if not entries:
+            return None
+        if best:
+            return max(entries, key=lambda entry: entry.weight).move
+        return self.random.choices(entries, weights=[entry.weight for entry in entries])[0].move
+
+    @staticmethod
+    def decode(board, code):
+        # Polyglot counts ranks from white's side and encodes castling as the king taking its rook
+        end = (7 - (code >> 3 & 7), code & 7)
+        start = (7 - (code >> 9 & 7), code >> 6 & 7)
+        promotion = POLYGLOT_PROMOTIONS.get(code >> 12 & 7)
+        piece = board.board[start[0]][start[1]]
+        if piece is not None and piece.symbol == 'K' and start[1] == 4 and end[1] in (0, 7):
+            target = board.board[end[0]][end[1]]
+            if target is not None and target.symbol == 'R' and target.color == piece.color:
+                end = (end[0], 6 if end[1] == 7 else 2)
+        return Move(start, end, promotion)
+
+    @staticmethod
+    def encode(board, move):
+        """Return the Polyglot code of a move in the position, as stored in book files"""
+        (start_x, start_y), (end_x, end_y) = move[0], move[1]
+        piece = board.board[start_x][start_y]
+        if piece is not None and piece.symbol == 'K' and abs(end_y - start_y) == 2:
+            end_y = 7 if end_y > start_y else 0
+        code = end_y | (7 - end_x) << 3 | start_y << 6 | (7 - start_x) << 9
+        if len(move) > 2 and move[2]:
+            code |= {symbol: number for number, symbol in POLYGLOT_PROMOTIONS.items()}[move[2]] << 12
+        return code
@@ -1,27 +1,65 @@
-import json
-from copy import deepcopy
+import sys
+from collections import OrderedDict, namedtuple
+
+from .evaluation import MIDGAME_SCORES, ENDGAME_SCORES, PHASE_WEIGHTS, SEE_VALUES, compute_scores
+from .zobrist import (PIECE_KEYS, CASTLING_KEYS, EN_PASSANT_KEYS, TURN_KEY,
+                      WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)
 
 __version__ = '0.5.0'
-__all__ = ['play_chess', 'ChessBoard']
+__all__ = ['play_chess', 'ChessBoard', 'Move', 'MoveCache', 'encode_move', 'decode_move']
+
+# A move as accepted by ChessBoard.push: start and end are (row, col) tuples and
+# promotion is the symbol of the piece a pawn reaching the last rank turns into
+Move = namedtuple('Move', ['start', 'end', 'promotion'], defaults=(None,))
+
+# Directions used to look for attackers from the attacked square outwards
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+KNIGHT_OFFSETS = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
+KING_OFFSETS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
 
 class ChessPiece:
-    def __init__(self, color, symbol):
-        self.color = color
-        self.symbol = symbol
-        self.has_moved = False
+    """A piece of one type and color.
 
-    def to_dict(self):
+    Pieces keep no state of their own, whether they have moved or can be taken en passant
+    is kept by the board, so there is one shared instance per type and color:
+    Pawn('white') always returns the same object.
+    """
+    __slots__ = ('color',)
+    instances = {}
+
+    def __new__(cls, color):
+        piece = ChessPiece.instances.get((cls, color))
+        if piece is None:
+            piece = super().__new__(cls)
+            piece.color = color
+            ChessPiece.instances[(cls, color)] = piece
+        return piece
+
+    def __reduce__(self):
+        # Unpickle to the shared instance
+        return self.__class__, (self.color,)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.color!r})"
+
+    def to_dict(self, has_moved=True):
         return {
             'color': self.color,
             'symbol': self.symbol,
-            'has_moved': self.has_moved,
+            'has_moved': has_moved,
             'type': self.__class__.__name__
         }
 
 class Pawn(ChessPiece):
-    def __init__(self, color):
-        super().__init__(color, 'P')
-        self.en_passant_vulnerable = False
+    __slots__ = ()
+    symbol = 'P'
         
     def valid_moves(self, board, pos, check_king_safety=True):
         moves = []
@@ -33,7 +71,7 @@ class Pawn(ChessPiece):
             moves.append((x + direction, y))
             
             # Initial two-square move
-            if not self.has_moved and 0 <= x + 2*direction < 8 and board.board[x + 2*direction][y] is None:
+            if x == PAWN_ROWS[self.color] and board.board[x + 2*direction][y] is None:
                 moves.append((x + 2*direction, y))
         
         # Capture diagonally
@@ -44,26 +82,23 @@ class Pawn(ChessPiece):
                     moves.append((x + direction, y + dy))
                     
         # En passant
-        if (self.color == 'white' and x == 3) or (self.color == 'black' and x == 4):
-            for dy in [-1, 1]:
-                if 0 <= y + dy < 8:
-                    target = board.board[x][y + dy]
-                    if isinstance(target, Pawn) and target.en_passant_vulnerable:
-                        moves.append((x + direction, y + dy))
+        target = board.en_passant_square
+        if target is not None and target[0] == x + direction and abs(target[1] - y) == 1:
+            moves.append(target)
 
         if check_king_safety:
             moves = [move for move in moves if not board.would_be_in_check(pos, move, self.color)]
         
         return moves
 
-    def to_dict(self):
-        data = super().to_dict()
-        data['en_passant_vulnerable'] = self.en_passant_vulnerable
+    def to_dict(self, has_moved=True, en_passant_vulnerable=False):
+        data = super().to_dict(has_moved)
+        data['en_passant_vulnerable'] = en_passant_vulnerable
         return data
 
 class Rook(ChessPiece):
-    def __init__(self, color):
-        super().__init__(color, 'R')
+    __slots__ = ()
+    symbol = 'R'
         
     def valid_moves(self, board, pos, check_king_safety=True):
         moves = []
@@ -91,8 +126,8 @@ class Rook(ChessPiece):
         return moves
 
 class Knight(ChessPiece):
-    def __init__(self, color):
-        super().__init__(color, 'N')
+    __slots__ = ()
+    symbol = 'N'
         
     def valid_moves(self, board, pos, check_king_safety=True):
         moves = []
@@ -115,8 +150,8 @@ class Knight(ChessPiece):
         return moves
 
 class Bishop(ChessPiece):
-    def __init__(self, color):
-        super().__init__(color, 'B')
+    __slots__ = ()
+    symbol = 'B'
         
     def valid_moves(self, board, pos, check_king_safety=True):
         moves = []
@@ -144,8 +179,8 @@ class Bishop(ChessPiece):
         return moves
 
 class Queen(ChessPiece):
-    def __init__(self, color):
-        super().__init__(color, 'Q')
+    __slots__ = ()
+    symbol = 'Q'
         
     def valid_moves(self, board, pos, check_king_safety=True):
         moves = []
@@ -174,8 +209,8 @@ class Queen(ChessPiece):
         return moves
 
 class King(ChessPiece):
-    def __init__(self, color):
-        super().__init__(color, 'K')
+    __slots__ = ()
+    symbol = 'K'
         
     def valid_moves(self, board, pos, check_king_safety=True):
         moves = []
@@ -195,7 +230,7 @@ class King(ChessPiece):
                         moves.append(move)
 
         # Castling
-        if check_king_safety and not self.has_moved and not board.is_in_check(self.color):
+        if check_king_safety and board.castling & CASTLING_MASKS[self.color] and not board.is_in_check(self.color):
             # Kingside castling
             if (self.can_castle_kingside(board)):
                 moves.append((x, y + 2))
@@ -207,9 +242,8 @@ class King(ChessPiece):
 
     def can_castle_kingside(self, board):
         row = 7 if self.color == 'white' else 0
-        # Check if rook is in place and hasn't moved
-        rook = board.board[row][7]
-        if not isinstance(rook, Rook) or rook.has_moved:
+        # Check that neither the king nor the rook has moved
+        if not board.castling & (WHITE_KINGSIDE if self.color == 'white' else BLACK_KINGSIDE):
             return False
         # Check if path is clear
         return (board.board[row][5] is None and 
@@ -219,9 +253,8 @@ class King(ChessPiece):
 
     def can_castle_queenside(self, board):
         row = 7 if self.color == 'white' else 0
-        # Check if rook is in place and hasn't moved
-        rook = board.board[row][0]
-        if not isinstance(rook, Rook) or rook.has_moved:
+        # Check that neither the king nor the rook has moved
+        if not board.castling & (WHITE_QUEENSIDE if self.color == 'white' else BLACK_QUEENSIDE):
             return False
         # Check if path is clear
         return (board.board[row][1] is None and 
@@ -230,12 +263,145 @@ class King(ChessPiece):
                 not board.is_square_under_attack((row, 2), self.color) and
                 not board.is_square_under_attack((row, 3), self.color))
 
+# Piece classes by symbol, also the pieces a pawn can be promoted to
+PIECE_TYPES = {'P': Pawn, 'R': Rook, 'N': Knight, 'B': Bishop, 'Q': Queen, 'K': King}
+PROMOTIONS = 'QRBN'
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+# Save files with this extension are written in the compact binary format
+BINARY_EXTENSION = '.chess'
+
+# FEN letters of the pieces, and the castling letters and back rank of each color
+FEN_PIECES = {symbol if color == 'white' else symbol.lower(): (piece_type, color)
+              for symbol, piece_type in PIECE_TYPES.items() for color in ('white', 'black')}
+CASTLING_LETTERS = {'white': 'KQ', 'black': 'kq'}
+HOME_ROWS = {'white': 7, 'black': 0}
+PAWN_ROWS = {'white': 6, 'black': 1}
+
+# Castling rights as bits of a 4-bit mask, and the rights of each color
+CASTLING_BITS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+CASTLING_MASKS = {'white': WHITE_KINGSIDE | WHITE_QUEENSIDE, 'black': BLACK_KINGSIDE | BLACK_QUEENSIDE}
+ALL_CASTLING = CASTLING_MASKS['white'] | CASTLING_MASKS['black']
+
+# Rights kept by a move from or to each square: moving the king or a rook, or capturing
+# a rook on its home square, loses the rights that depend on it
+CASTLING_SQUARE_MASKS = [ALL_CASTLING] * 64
+CASTLING_SQUARE_MASKS[0] = ALL_CASTLING & ~BLACK_QUEENSIDE
+CASTLING_SQUARE_MASKS[4] = ALL_CASTLING & ~CASTLING_MASKS['black']
+CASTLING_SQUARE_MASKS[7] = ALL_CASTLING & ~BLACK_KINGSIDE
+CASTLING_SQUARE_MASKS[56] = ALL_CASTLING & ~WHITE_QUEENSIDE
+CASTLING_SQUARE_MASKS[60] = ALL_CASTLING & ~CASTLING_MASKS['white']
+CASTLING_SQUARE_MASKS[63] = ALL_CASTLING & ~WHITE_KINGSIDE
+
+# Estimated memory of a cached position and of each of its moves, a Move and its end square
+# (the start square is shared by the moves of a piece)
+CACHE_ENTRY_BYTES = 200
+CACHE_MOVE_BYTES = sys.getsizeof(Move((0, 0), (0, 0))) + sys.getsizeof((0, 0)) + 8
+
+class MoveCache:
+    """Least recently used cache of the legal moves of positions, keyed by Zobrist key.
+
+    The moves of a position are generated once for everything that asks for them: the
+    moves of a clicked piece, the validation of a move and the engine's first ply, and
+    game_status uses them when they are there. Positions are dropped, least recently used first, once the estimated size of the
+    cache passes max_bytes. hits and misses count the lookups.
+    The dict operations used are atomic, so a GUI and an engine thread can share it.
+    """
+
+    def __init__(self, max_bytes=8 << 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the tuple of moves cached for key, or None"""
+        moves = self.entries.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            pass  # Dropped by another thread in between
+        return moves
+
+    def put(self, key, moves):
+        # Only the thread whose moves went in counts their size
+        if self.entries.setdefault(key, moves) is not moves:
+            return
+        self.size += CACHE_ENTRY_BYTES + CACHE_MOVE_BYTES * len(moves)
+        while self.size > self.max_bytes:
+            try:
+                _, dropped = self.entries.popitem(last=False)
+            except KeyError:
+                break
+            self.size -= CACHE_ENTRY_BYTES + CACHE_MOVE_BYTES * len(dropped)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """Return the counters and size of the cache as a dict"""
+        lookups = self.hits + self.misses
+        return {
+            'positions': len(self.entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+        }
+
 class ChessBoard:
-    def __init__(self):
+    # Legal moves of the positions seen, shared by every board of the class;
+    # set it to None on a board or subclass to generate them every time
+    move_cache = MoveCache()
+
+    def __init__(self, setup=True):
         self.board = [[None for _ in range(8)] for _ in range(8)]
         self.current_player = 'white'
         self.move_history = []
-        self.setup_board()
+        # Square a pawn passed over moving two squares on the last move, where it can be taken en passant
+        self.en_passant_square = None
+        # Castling rights still available, a 4-bit mask of the zobrist castling bits
+        self.castling = 0
+        # Undo records of the moves made with make_move, consumed by pop
+        self.undo_stack = []
+        # Halfmove clock and fullmove number before the first move of undo_stack
+        self.fen_counters = (0, 1)
+        # GameJournal the moves of the game are appended to as they are played
+        self.journal = None
+        # (zobrist_key, status) of the last position game_status was asked about
+        self.status_cache = None
+        if setup:
+            self.setup_board()
+            # 64-bit key of the position, kept up to date on every move
+            self.zobrist_key = self.compute_zobrist_key()
+            # Middlegame score, endgame score and phase of the position, kept up to date on every move
+            self.scores = compute_scores(self)
+        else:
+            # An empty board, whoever fills it sets the key and scores with compute_zobrist_key and compute_scores
+            self.zobrist_key = None
+            self.scores = None
+
+    def __getstate__(self):
+        # The journal file stays with the board that opened it
+        state = self.__dict__.copy()
+        state['journal'] = None
+        return state
+
+    def copy(self):
+        """Return an independent copy of the board, with its history but without its journal"""
+        import pickle
+        return pickle.loads(pickle.dumps(self, pickle.HIGHEST_PROTOCOL))
 
     def setup_board(self):
         # Set up pawns
@@ -248,6 +414,72 @@ class ChessBoard:
         for y in range(8):
             self.board[0][y] = piece_order[y]('black')
             self.board[7][y] = piece_order[y]('white')
+        self.castling = ALL_CASTLING
+
+    def castling_rights(self):
+        """Return the castling rights as a 4-bit mask"""
+        return self.castling
+
+    def possible_castling(self, rights):
+        """Keep only the castling rights of rights whose king and rook are on their home squares"""
+        for letter, bit in CASTLING_BITS.items():
+            color = 'white' if letter.isupper() else 'black'
+            row = HOME_ROWS[color]
+            king = self.board[row][4]
+            rook = self.board[row][7 if letter in 'Kk' else 0]
+            if not (isinstance(king, King) and king.color == color and
+                    isinstance(rook, Rook) and rook.color == color):
+                rights &= ~bit
+        return rights
+
+    def en_passant_key(self, square):
+        """Key of the en passant file when square is the en passant square"""
+        # As in Polyglot, the file only counts when an enemy pawn is there to capture
+        x, y = square
+        row, color = (4, 'black') if x == 5 else (3, 'white')
+        for col in (y - 1, y + 1):
+            if 0 <= col < 8:
+                piece = self.board[row][col]
+                if isinstance(piece, Pawn) and piece.color == color:
+                    return EN_PASSANT_KEYS[y]
+        return 0
+
+    def compute_zobrist_key(self):
+        """Compute the Zobrist key of the position from scratch"""
+        key = 0
+        for i in range(8):
+            for j in range(8):
+                piece = self.board[i][j]
+                if piece:
+                    key ^= PIECE_KEYS[piece.color][piece.symbol][i * 8 + j]
+        return key ^ self.state_key()
+
+    def state_key(self):
+        """Part of the Zobrist key for the castling rights, the en passant file and the player to move"""
+        key = CASTLING_KEYS[self.castling]
+        if self.en_passant_square is not None:
+            key ^= self.en_passant_key(self.en_passant_square)
+        if self.current_player == 'white':
+            key ^= TURN_KEY
+        return key
+
+    def switch_player(self):
+        """Pass the turn to the other player"""
+        self.current_player = 'black' if self.current_player == 'white' else 'white'
+        self.zobrist_key ^= TURN_KEY
+
+    def piece_moves(self, pos, check_king_safety=True):
+        """Return the squares the piece at pos can move to"""
+        piece = self.board[pos[0]][pos[1]]
+        if piece is None:
+            return []
+        if check_king_safety:
+            if piece.color == self.current_player:
+                moves = [move for move in self.cached_legal_moves() if move[0] == pos]
+            else:
+                moves = self.legal_moves(piece.color, pos)
+            return [end for _, end, promotion in moves if promotion in (None, 'Q')]
+        return piece.valid_moves(self, pos, check_king_safety)
 
     def get_king_position(self, color):
         for i in range(8):
@@ -257,15 +489,94 @@ class ChessBoard:
                     return (i, j)
         return None
 
+    def iter_attackers(self, pos, color):
+        """Yield the positions of the enemy pieces of color that attack pos"""
+        board = self.board
+        x, y = pos
+        
+        # Pawns attack diagonally towards the opposite side
+        row = x - 1 if color == 'white' else x + 1
+        if 0 <= row < 8:
+            for col in (y - 1, y + 1):
+                if 0 <= col < 8:
+                    piece = board[row][col]
+                    if piece and piece.color != color and piece.symbol == 'P':
+                        yield (row, col)
+        
+        for dx, dy in KNIGHT_OFFSETS:
+            row, col = x + dx, y + dy
+            if 0 <= row < 8 and 0 <= col < 8:
+                piece = board[row][col]
+                if piece and piece.color != color and piece.symbol == 'N':
+                    yield (row, col)
+        
+        for dx, dy in KING_OFFSETS:
+            row, col = x + dx, y + dy
+            if 0 <= row < 8 and 0 <= col < 8:
+                piece = board[row][col]
+                if piece and piece.color != color and piece.symbol == 'K':
+                    yield (row, col)
+        
+        # Cast rays outwards and stop at the first piece found on each one
+        for directions, sliders in ((ROOK_DIRECTIONS, 'RQ'), (BISHOP_DIRECTIONS, 'BQ')):
+            for dx, dy in directions:
+                row, col = x + dx, y + dy
+                while 0 <= row < 8 and 0 <= col < 8:
+                    piece = board[row][col]
+                    if piece:
+                        if piece.color != color and piece.symbol in sliders:
+                            yield (row, col)
+                        break
+                    row, col = row + dx, col + dy
+
+    def attackers_of(self, pos, color):
+        """Return the positions of the enemy pieces of color that attack pos"""
+        return list(self.iter_attackers(pos, color))
+
+    def see(self, start, end):
+        """Static exchange evaluation: the material won by the move from start to end once both
+        players have recaptured on end with their least valuable piece for as long as it pays"""
+        board = self.board
+        piece = board[start[0]][start[1]]
+        victim_pos = end
+        if board[end[0]][end[1]] is None and piece.symbol == 'P' and start[1] != end[1]:
+            victim_pos = (start[0], end[1])
+        victim = board[victim_pos[0]][victim_pos[1]]
+        gains = [SEE_VALUES[victim.symbol] if victim else 0]
+        
+        # Lift the pieces that have captured off the board, so the sliders behind them join in
+        lifted = [(start, piece)]
+        board[start[0]][start[1]] = None
+        if victim_pos != end:
+            lifted.append((victim_pos, victim))
+            board[victim_pos[0]][victim_pos[1]] = None
+        value = SEE_VALUES[piece.symbol]
+        color = piece.color
+        try:
+            while True:
+                # The player who just captured is now the one being attacked
+                attackers = [(SEE_VALUES[board[x][y].symbol], (x, y)) for x, y in self.iter_attackers(end, color)]
+                if not attackers:
+                    break
+                attacker_value, (x, y) = min(attackers)
+                gains.append(value - gains[-1])
+                lifted.append(((x, y), board[x][y]))
+                color = board[x][y].color
+                board[x][y] = None
+                value = attacker_value
+        finally:
+            for (x, y), lifted_piece in lifted:
+                board[x][y] = lifted_piece
+        
+        # Either player can stop capturing when going on would lose material
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = -max(-gains[-1], gain)
+        return gains[0]
+
     def is_square_under_attack(self, pos, color):
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j]
-                if piece and piece.color != color:
-                    # Check piece's moves without considering king safety to avoid recursion
-                    moves = piece.valid_moves(self, (i, j), check_king_safety=False)
-                    if pos in moves:
-                        return True
+        for _ in self.iter_attackers(pos, color):
+            return True
         return False
 
     def is_in_check(self, color):
@@ -274,34 +585,175 @@ class ChessBoard:
 
     def would_be_in_check(self, start, end, color):
         # Make a temporary move and check if it puts/leaves the king in check
-        temp_board = deepcopy(self)
-        temp_board.make_move(start, end, check_rules=False)
-        return temp_board.is_in_check(color)
+        self.push((start, end))
+        in_check = self.is_in_check(color)
+        self.pop()
+        return in_check
+
+    def pinned_pieces(self, color):
+        """Return a dict from the position of each piece of color pinned to its king to the pin direction"""
+        pinned = {}
+        king_pos = self.get_king_position(color)
+        if king_pos is None:
+            return pinned
+        for directions, sliders in ((ROOK_DIRECTIONS, 'RQ'), (BISHOP_DIRECTIONS, 'BQ')):
+            for dx, dy in directions:
+                row, col = king_pos[0] + dx, king_pos[1] + dy
+                candidate = None
+                while 0 <= row < 8 and 0 <= col < 8:
+                    piece = self.board[row][col]
+                    if piece:
+                        if piece.color == color:
+                            if candidate is not None:
+                                break
+                            candidate = (row, col)
+                        else:
+                            if candidate is not None and piece.symbol in sliders:
+                                pinned[candidate] = (dx, dy)
+                            break
+                    row, col = row + dx, col + dy
+        return pinned
+
+    def king_exposed(self, start, end, color):
+        """Whether moving start to end leaves the king of color attacked, tested by lifting
+        the pieces involved off the board instead of making the move"""
+        board = self.board
+        piece = board[start[0]][start[1]]
+        captured = board[end[0]][end[1]]
+        en_passant = piece.symbol == 'P' and start[1] != end[1] and captured is None
+        if en_passant:
+            captured = board[start[0]][end[1]]
+            board[start[0]][end[1]] = None
+        board[start[0]][start[1]] = None
+        board[end[0]][end[1]] = piece
+        king_pos = end if piece.symbol == 'K' else self.get_king_position(color)
+        exposed = self.is_square_under_attack(king_pos, color)
+        board[end[0]][end[1]] = None if en_passant else captured
+        board[start[0]][start[1]] = piece
+        if en_passant:
+            board[start[0]][end[1]] = captured
+        return exposed
+
+    def legal_moves(self, color=None, pos=None):
+        """Yield the legal moves of color (the player to move by default), only those of the piece at pos if given"""
+        if color is None:
+            color = self.current_player
+        king_pos = self.get_king_position(color)
+        if king_pos is None:
+            return
+        kx, ky = king_pos
+        checkers = self.attackers_of(king_pos, color)
+        
+        # King moves, including castling when not in check
+        if pos is None or pos == king_pos:
+            king = self.board[kx][ky]
+            for dx, dy in KING_OFFSETS:
+                x, y = kx + dx, ky + dy
+                if 0 <= x < 8 and 0 <= y < 8:
+                    target = self.board[x][y]
+                    if (target is None or target.color != color) and not self.king_exposed(king_pos, (x, y), color):
+                        yield Move(king_pos, (x, y))
+            if not checkers and self.castling & CASTLING_MASKS[color]:
+                if king.can_castle_kingside(self):
+                    yield Move(king_pos, (kx, ky + 2))
+                if king.can_castle_queenside(self):
+                    yield Move(king_pos, (kx, ky - 2))
+        
+        # In double check only the king can move
+        if len(checkers) > 1:
+            return
+        
+        # In single check the other pieces must capture the checker or block its line
+        evasions = None
+        if checkers:
+            cx, cy = checkers[0]
+            evasions = {(cx, cy)}
+            if self.board[cx][cy].symbol in 'RBQ':
+                dx = (cx > kx) - (cx < kx)
+                dy = (cy > ky) - (cy < ky)
+                x, y = kx + dx, ky + dy
+                while (x, y) != (cx, cy):
+                    evasions.add((x, y))
+                    x, y = x + dx, y + dy
+        
+        pinned = self.pinned_pieces(color)
+        positions = [pos] if pos is not None else [(i, j) for i in range(8) for j in range(8)]
+        for start in positions:
+            piece = self.board[start[0]][start[1]]
+            if piece is None or piece.color != color or start == king_pos:
+                continue
+            pin = pinned.get(start)
+            for end in self.piece_moves(start, check_king_safety=False):
+                if pin is not None:
+                    # A pinned piece can only move along the line of the pin
+                    if pin[0] * (end[1] - ky) != pin[1] * (end[0] - kx):
+                        continue
+                en_passant = piece.symbol == 'P' and end[1] != start[1] and self.board[end[0]][end[1]] is None
+                if evasions is not None and end not in evasions:
+                    # En passant can capture a checking pawn without landing on its square
+                    if not (en_passant and (start[0], end[1]) in evasions):
+                        continue
+                if en_passant and self.king_exposed(start, end, color):
+                    # Removing both pawns from the rank can expose the king
+                    continue
+                if piece.symbol == 'P' and end[0] in (0, 7):
+                    for promotion in PROMOTIONS:
+                        yield Move(start, end, promotion)
+                else:
+                    yield Move(start, end)
+
+    def cached_legal_moves(self):
+        """Return a tuple of the legal moves of the player to move, generated only when
+        the position is not in move_cache"""
+        cache, key = self.move_cache, self.zobrist_key
+        if cache is None or key is None:
+            return tuple(self.legal_moves())
+        moves = cache.get(key)
+        if moves is None:
+            moves = tuple(self.legal_moves())
+            cache.put(key, moves)
+        return moves
+
+    def game_status(self):
+        """Return 'checkmate', 'stalemate', 'check' or 'playing' for the player to move.
+
+        Check is tested once and the legal moves come from the move cache when they are in it;
+        otherwise generation stops at the first legal move, and the full list is only made
+        and cached by the callers that need it. The result is kept until the position changes."""
+        key = self.zobrist_key
+        if key is not None and self.status_cache is not None and self.status_cache[0] == key:
+            return self.status_cache[1]
+        in_check = self.is_in_check(self.current_player)
+        moves = self.move_cache.get(key) if self.move_cache is not None and key is not None else None
+        if moves is None:
+            moves = next(self.legal_moves(), None) is not None
+        if moves:
+            status = 'check' if in_check else 'playing'
+        else:
+            status = 'checkmate' if in_check else 'stalemate'
+        self.status_cache = (key, status)
+        return status
 
     def is_checkmate(self, color):
+        if color == self.current_player:
+            return self.game_status() == 'checkmate'
         if not self.is_in_check(color):
             return False
             
         # Check if any piece has valid moves
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j]
-                if piece and piece.color == color:
-                    if piece.valid_moves(self, (i, j)):
-                        return False
+        for _ in self.legal_moves(color):
+            return False
         return True
 
     def is_stalemate(self, color):
+        if color == self.current_player:
+            return self.game_status() == 'stalemate'
         if self.is_in_check(color):
             return False
             
         # Check if any piece has valid moves
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j]
-                if piece and piece.color == color:
-                    if piece.valid_moves(self, (i, j)):
-                        return False
+        for _ in self.legal_moves(color):
+            return False
         return True
 
     def handle_castling(self, start, end):
@@ -314,7 +766,8 @@ class ChessBoard:
             rook = self.board[start_x][7]
             self.board[start_x][5] = rook
             self.board[start_x][7] = None
-            rook.has_moved = True
+            keys = PIECE_KEYS[rook.color]['R']
+            self.zobrist_key ^= keys[start_x * 8 + 7] ^ keys[start_x * 8 + 5]
             
         # Queenside castling
         elif isinstance(self.board[start_x][start_y], King) and end_y - start_y == -2:
@@ -322,75 +775,185 @@ class ChessBoard:
             rook = self.board[start_x][0]
             self.board[start_x][3] = rook
             self.board[start_x][0] = None
-            rook.has_moved = True
+            keys = PIECE_KEYS[rook.color]['R']
+            self.zobrist_key ^= keys[start_x * 8] ^ keys[start_x * 8 + 3]
 
     def handle_en_passant(self, start, end):
         start_x, start_y = start
         end_x, end_y = end
         
-        # Reset en passant vulnerability for all pawns
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j]
-                if isinstance(piece, Pawn):
-                    piece.en_passant_vulnerable = False
+        # The en passant square only lasts for one move
+        if self.en_passant_square is not None:
+            self.zobrist_key ^= self.en_passant_key(self.en_passant_square)
+            self.en_passant_square = None
         
-        # Set en passant vulnerability for two-square pawn moves
-        if isinstance(self.board[start_x][start_y], Pawn):
+        # A two-square pawn move can be taken en passant on the square it passed over
+        pawn = self.board[start_x][start_y]
+        if isinstance(pawn, Pawn):
             if abs(end_x - start_x) == 2:
-                self.board[start_x][start_y].en_passant_vulnerable = True
+                self.en_passant_square = ((start_x + end_x) // 2, start_y)
+                self.zobrist_key ^= self.en_passant_key(self.en_passant_square)
             
             # Handle en passant capture
             if end_y != start_y and self.board[end_x][end_y] is None:
+                captured = self.board[start_x][end_y]
+                self.zobrist_key ^= PIECE_KEYS[captured.color]['P'][start_x * 8 + end_y]
                 self.board[start_x][end_y] = None  # Remove captured pawn
 
-    def make_move(self, start, end, check_rules=True):
+    def make_move(self, start, end, check_rules=True, promotion=None):
         start_x, start_y = start
         end_x, end_y = end
         
         piece = self.board[start_x][start_y]
         
         if check_rules:
-            valid_moves = piece.valid_moves(self, start)
-            if end not in valid_moves:
+            valid_moves = self.piece_moves(start)
+            if end not in valid_moves or (promotion is not None and promotion not in PROMOTIONS):
                 return False
         
+        # Record everything needed to take the move back
+        captured = self.board[end_x][end_y]
+        captured_pos = end
+        rook_move = None
+        if isinstance(piece, Pawn) and end_y != start_y and captured is None:
+            captured_pos = (start_x, end_y)
+            captured = self.board[start_x][end_y]
+        elif isinstance(piece, King) and abs(end_y - start_y) == 2:
+            rook_y, rook_end_y = (7, 5) if end_y > start_y else (0, 3)
+            rook_move = ((start_x, rook_y), (start_x, rook_end_y))
+        promoted = None
+        if isinstance(piece, Pawn) and end_x in (0, 7):
+            promoted = PIECE_TYPES[promotion or 'Q'](piece.color)
+        self.undo_stack.append((start, end, piece, self.castling, captured, captured_pos,
+                                rook_move, self.en_passant_square, self.current_player, promoted,
+                                self.zobrist_key, self.scores))
+        
+        # Update the evaluation terms for the pieces that move, appear and disappear
+        midgame, endgame, phase = self.scores
+        from_sq, to_sq = start_x * 8 + start_y, end_x * 8 + end_y
+        placed = piece if promoted is None else promoted
+        midgame_scores, endgame_scores = MIDGAME_SCORES[piece.color], ENDGAME_SCORES[piece.color]
+        midgame += midgame_scores[placed.symbol][to_sq] - midgame_scores[piece.symbol][from_sq]
+        endgame += endgame_scores[placed.symbol][to_sq] - endgame_scores[piece.symbol][from_sq]
+        if promoted is not None:
+            phase += PHASE_WEIGHTS[promoted.symbol]
+        if captured is not None:
+            sq = captured_pos[0] * 8 + captured_pos[1]
+            midgame -= MIDGAME_SCORES[captured.color][captured.symbol][sq]
+            endgame -= ENDGAME_SCORES[captured.color][captured.symbol][sq]
+            phase -= PHASE_WEIGHTS[captured.symbol]
+        if rook_move is not None:
+            (rook_x, rook_y), (_, rook_end_y) = rook_move
+            rook_from, rook_to = rook_x * 8 + rook_y, rook_x * 8 + rook_end_y
+            midgame += midgame_scores['R'][rook_to] - midgame_scores['R'][rook_from]
+            endgame += endgame_scores['R'][rook_to] - endgame_scores['R'][rook_from]
+        self.scores = (midgame, endgame, phase)
+        
+        # Castling rights only change when a king or rook moves or a rook is captured
+        castling = self.castling & CASTLING_SQUARE_MASKS[from_sq] & CASTLING_SQUARE_MASKS[to_sq]
+        if castling != self.castling:
+            self.zobrist_key ^= CASTLING_KEYS[self.castling] ^ CASTLING_KEYS[castling]
+            self.castling = castling
+        
         # Handle special moves
         self.handle_castling(start, end)
         self.handle_en_passant(start, end)
         
         # Make the move
-        self.board[end_x][end_y] = piece
+        target = self.board[end_x][end_y]
+        if target is not None:
+            self.zobrist_key ^= PIECE_KEYS[target.color][target.symbol][end_x * 8 + end_y]
+        placed = piece if promoted is None else promoted
+        self.zobrist_key ^= (PIECE_KEYS[piece.color][piece.symbol][start_x * 8 + start_y] ^
+                             PIECE_KEYS[placed.color][placed.symbol][end_x * 8 + end_y])
+        self.board[end_x][end_y] = placed
         self.board[start_x][start_y] = None
-        piece.has_moved = True
         
         return True
 
-    def move_piece(self, start, end):
+    def push(self, move):
+        """Make a move without checking the rules and pass the turn, it can be taken back with pop"""
+        self.make_move(move[0], move[1], check_rules=False, promotion=move[2] if len(move) > 2 else None)
+        self.switch_player()
+
+    def pop(self):
+        """Take back the last move made and return it"""
+        (start, end, piece, castling, captured, captured_pos,
+         rook_move, en_passant_square, player, promoted, key, scores) = self.undo_stack.pop()
+        
+        # Move the piece back and restore any captured piece
+        self.board[end[0]][end[1]] = None
+        self.board[start[0]][start[1]] = piece
+        if captured is not None:
+            self.board[captured_pos[0]][captured_pos[1]] = captured
+        
+        # Move the castling rook back
+        if rook_move is not None:
+            (rook_x, rook_y), (rook_end_x, rook_end_y) = rook_move
+            self.board[rook_x][rook_y] = self.board[rook_end_x][rook_end_y]
+            self.board[rook_end_x][rook_end_y] = None
+        
+        self.castling = castling
+        self.en_passant_square = en_passant_square
+        self.current_player = player
+        self.zobrist_key = key
+        self.scores = scores
+        return Move(start, end, promoted.symbol if promoted else None)
+
+    def undo_move(self):
+        """Take back the last move played in the game"""
+        if not self.undo_stack or not self.move_history:
+            return False
+        self.pop()
+        self.move_history.pop()
+        if self.journal is not None:
+            self.journal.undo()
+        return True
+
+    def record_move(self, piece, start, end):
+        """Add the move just played by piece to the history of the game, and to its journal if any"""
+        entry = {
+            'start': start,
+            'end': end,
+            'piece': piece.symbol,
+            'color': piece.color
+        }
+        promoted = self.undo_stack[-1][9]
+        if promoted:
+            entry['promotion'] = promoted.symbol
+        self.move_history.append(entry)
+        if self.journal is not None:
+            self.journal.append(Move(start, end, entry.get('promotion')))
+
+    def game_record(self):
+        """Return the FEN of the position the game started from and the moves of move_history.
+
+        The start is found by taking the moves back on a copy, so the board itself is only
+        read and can be saved from another thread, or is the standard starting position
+        when the board was restored from a save without them."""
+        count = len(self.move_history)
+        if len(self.undo_stack) < count:
+            return STARTING_FEN, [Move(tuple(entry['start']), tuple(entry['end']), entry.get('promotion'))
+                                  for entry in self.move_history]
+        replay = self.copy()
+        moves = [replay.pop() for _ in range(count)][::-1]
+        return replay.to_fen(), moves
+
+    def move_piece(self, start, end, promotion=None):
         piece = self.board[start[0]][start[1]]
         if piece is None or piece.color != self.current_player:
             return False
 
-        if self.make_move(start, end):
-            # Record move in history
-            self.move_history.append({
-                'start': start,
-                'end': end,
-                'piece': piece.symbol,
-                'color': piece.color
-            })
-            
+        if self.make_move(start, end, promotion=promotion):
             # Switch players
-            self.current_player = 'black' if self.current_player == 'white' else 'white'
+            self.switch_player()
+            
+            # Record move in history
+            self.record_move(piece, start, end)
             
             # Check for checkmate or stalemate
-            if self.is_checkmate(self.current_player):
-                return 'checkmate'
-            elif self.is_stalemate(self.current_player):
-                return 'stalemate'
-            elif self.is_in_check(self.current_player):
-                return 'check'
-            return True
+            status = self.game_status()
+            return True if status == 'playing' else status
             
         return False
 
@@ -412,17 +975,37 @@ class ChessBoard:
     def to_dict(self):
         """Convert the board state to a dictionary for saving"""
         return {
-            'board': [[piece.to_dict() if piece else None for piece in row] 
-                     for row in self.board],
+            'board': [[self.piece_dict((i, j)) for j in range(8)] for i in range(8)],
             'current_player': self.current_player,
             'move_history': self.move_history
         }
 
+    def piece_dict(self, pos):
+        """Return the saved form of the piece at pos, with the has_moved and en_passant_vulnerable
+        flags that save files keep for each piece, or None for an empty square"""
+        x, y = pos
+        piece = self.board[x][y]
+        if piece is None:
+            return None
+        color = piece.color
+        if isinstance(piece, Pawn):
+            vulnerable = (self.en_passant_square is not None and
+                          self.en_passant_square == (x + 1 if color == 'white' else x - 1, y))
+            return piece.to_dict(x != PAWN_ROWS[color], vulnerable)
+        has_moved = True
+        if x == HOME_ROWS[color]:
+            if isinstance(piece, King) and y == 4:
+                has_moved = not self.castling & CASTLING_MASKS[color]
+            elif isinstance(piece, Rook) and y in (0, 7):
+                has_moved = not self.castling & CASTLING_BITS[CASTLING_LETTERS[color][0 if y == 7 else 1]]
+            elif not isinstance(piece, (King, Rook)):
+                has_moved = False
+        return piece.to_dict(has_moved)
+
     @classmethod
     def from_dict(cls, data):
         """Create a board from a saved dictionary state"""
-        board = cls()
-        board.board = [[None for _ in range(8)] for _ in range(8)]
+        board = cls(setup=False)
         
         # Piece type mapping
         piece_types = {
@@ -434,29 +1017,157 @@ class ChessBoard:
             'King': King
         }
         
-        # Restore board
+        # Restore board, with the castling rights and en passant square from the flags of the pieces
+        castling = ALL_CASTLING
         for i in range(8):
             for j in range(8):
                 piece_data = data['board'][i][j]
                 if piece_data:
                     piece_class = piece_types[piece_data['type']]
-                    piece = piece_class(piece_data['color'])
-                    piece.has_moved = piece_data['has_moved']
-                    if piece_data['type'] == 'Pawn':
-                        piece.en_passant_vulnerable = piece_data.get('en_passant_vulnerable', False)
-                    board.board[i][j] = piece
+                    color = piece_data['color']
+                    board.board[i][j] = piece_class(color)
+                    if piece_data['has_moved'] and i == HOME_ROWS[color]:
+                        if piece_class is King:
+                            castling &= ~CASTLING_MASKS[color]
+                        elif piece_class is Rook and j in (0, 7):
+                            castling &= ~CASTLING_BITS[CASTLING_LETTERS[color][0 if j == 7 else 1]]
+                    if piece_class is Pawn and piece_data.get('en_passant_vulnerable', False):
+                        board.en_passant_square = (i + 1 if color == 'white' else i - 1, j)
+        board.castling = board.possible_castling(castling)
         
         board.current_player = data['current_player']
         board.move_history = data['move_history']
+        board.zobrist_key = board.compute_zobrist_key()
+        board.scores = compute_scores(board)
         return board
 
+    @classmethod
+    def from_fen(cls, fen):
+        """Create a board from a position in Forsyth-Edwards Notation, or an EPD line whose operations are ignored"""
+        fields = fen.split()
+        placement, active = fields[0], fields[1]
+        castling = fields[2] if len(fields) > 2 else '-'
+        en_passant = fields[3] if len(fields) > 3 else '-'
+        
+        board = cls(setup=False)
+        rows = board.board
+        # Sum the key and evaluation terms of the pieces while placing them
+        key = midgame = endgame = phase = 0
+        for i, rank in enumerate(placement.split('/')):
+            row = rows[i]
+            j = 0
+            for char in rank:
+                if char in '12345678':
+                    j += int(char)
+                    continue
+                piece_type, color = FEN_PIECES[char]
+                piece = piece_type(color)
+                row[j] = piece
+                sq = i * 8 + j
+                key ^= PIECE_KEYS[color][piece.symbol][sq]
+                midgame += MIDGAME_SCORES[color][piece.symbol][sq]
+                endgame += ENDGAME_SCORES[color][piece.symbol][sq]
+                phase += PHASE_WEIGHTS[piece.symbol]
+                j += 1
+        
+        board.current_player = 'white' if active == 'w' else 'black'
+        rights = 0
+        for letter in castling:
+            rights |= CASTLING_BITS.get(letter, 0)
+        board.castling = board.possible_castling(rights)
+        if en_passant != '-':
+            x, y = convert_notation_to_index(en_passant)
+            # Only when the pawn that passed over the square is there
+            if isinstance(board.board[x - 1 if x == 5 else x + 1][y], Pawn):
+                board.en_passant_square = (x, y)
+        if len(fields) > 5 and fields[4].isdigit() and fields[5].isdigit():
+            board.fen_counters = (int(fields[4]), int(fields[5]))
+        board.zobrist_key = key ^ board.state_key()
+        board.scores = (midgame, endgame, phase)
+        return board
+
+    def to_fen(self):
+        """Return the position in Forsyth-Edwards Notation"""
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece.symbol if piece.color == 'white' else piece.symbol.lower()
+            ranks.append(rank + str(empty) if empty else rank)
+        
+        castling = ''.join(letter for letter, bit in CASTLING_BITS.items() if self.castling & bit) or '-'
+        en_passant = '-'
+        if self.en_passant_square is not None:
+            en_passant = convert_index_to_notation(*self.en_passant_square)
+        
+        # Count the moves made since the position the counters were given for
+        halfmove_clock, fullmove_number = self.fen_counters
+        clock = 0
+        for record in reversed(self.undo_stack):
+            if record[2].symbol == 'P' or record[4] is not None:
+                break
+            clock += 1
+        else:
+            clock += halfmove_clock
+        fullmove_number += sum(1 for record in self.undo_stack if record[8] == 'black')
+        
+        return (f"{'/'.join(ranks)} {'w' if self.current_player == 'white' else 'b'} "
+                f"{castling} {en_passant} {clock} {fullmove_number}")
+
+    def book_move(self, book, best=False):
+        """Return a move for the position from an OpeningBook, or None when it is not in the book"""
+        return book.choose(self, best)
+
+    def count_legal_moves(self, color=None):
+        """Return how many legal moves color (the player to move by default) has"""
+        return len(list(self.legal_moves(color)))
+
+    def perft(self, depth):
+        """Count the positions reached by every sequence of legal moves of the given length"""
+        if depth == 0:
+            return 1
+        if depth == 1:
+            return self.count_legal_moves()
+        moves = list(self.legal_moves())
+        nodes = 0
+        for move in moves:
+            self.push(move)
+            nodes += self.perft(depth - 1)
+            self.pop()
+        return nodes
+
+    def divide(self, depth):
+        """Return the perft count below each legal move, to find which move a wrong count comes from"""
+        counts = {}
+        for move in list(self.legal_moves()):
+            self.push(move)
+            counts[move] = self.perft(depth - 1)
+            self.pop()
+        return counts
+
 def save_game(board, filename):
-    """Save the current game state to a file"""
+    """Save the current game state to a file, in the binary format when its name ends in .chess"""
+    if filename.endswith(BINARY_EXTENSION):
+        from .savefile import save_binary
+        save_binary(board, filename)
+        return
+    import json
     with open(filename, 'w') as f:
         json.dump(board.to_dict(), f)
 
 def load_game(filename):
-    """Load a game state from a file"""
+    """Load a game state from a JSON or binary save file"""
+    from .savefile import is_binary, load_binary
+    if is_binary(filename):
+        return load_binary(filename)
+    import json
     with open(filename, 'r') as f:
         data = json.load(f)
     return ChessBoard.from_dict(data)
@@ -471,6 +1182,8 @@ def parse_move(input_str):
         return 'save', None
     elif input_str == 'load':
         return 'load', None
+    elif input_str == 'undo':
+        return 'undo', None
         
     # Try to parse full move format (e.g., "a2 to a4" or "a2a4" or "a2-a4")
     parts = input_str.replace('to', ' ').replace('-', ' ').split()
@@ -510,37 +1223,104 @@ def convert_index_to_notation(row, col):
     """Convert board indices to chess notation"""
     return f"{chr(col + ord('a'))}{8-row}"
 
-def play_chess():
+def convert_move_to_notation(move):
+    """Convert a move to coordinate notation (e.g., 'e2e4' or 'e7e8q')"""
+    notation = convert_index_to_notation(*move[0]) + convert_index_to_notation(*move[1])
+    if len(move) > 2 and move[2]:
+        notation += move[2].lower()
+    return notation
+
+def convert_notation_to_move(notation):
+    """Convert coordinate notation (e.g., 'e2e4' or 'e7e8q') to a Move"""
+    notation = notation.strip()
+    if len(notation) not in (4, 5) or (len(notation) == 5 and notation[4].upper() not in PROMOTIONS):
+        raise ValueError(f"Invalid move: {notation!r}. Use coordinate notation (e.g., 'e2e4' or 'e7e8q')")
+    promotion = notation[4].upper() if len(notation) == 5 else None
+    return Move(convert_notation_to_index(notation[:2]), convert_notation_to_index(notation[2:4]), promotion)
+
+def encode_move(move):
+    """Pack a move into 16 bits: start square, end square and promotion piece"""
+    (start_row, start_col), (end_row, end_col) = move[0], move[1]
+    promotion = move[2] if len(move) > 2 and move[2] else None
+    code = (start_row * 8 + start_col) | (end_row * 8 + end_col) << 6
+    if promotion:
+        code |= (PROMOTIONS.index(promotion) + 1) << 12
+    return code
+
+def decode_move(code):
+    """Unpack a move packed by encode_move"""
+    start, end, promotion = code & 63, code >> 6 & 63, code >> 12 & 7
+    return Move((start >> 3, start & 7), (end >> 3, end & 7), PROMOTIONS[promotion - 1] if promotion else None)
+
+def play_chess(engine_color=None, engine=None, journal=None):
+    """Play in the terminal, against the computer when engine_color is 'white' or 'black'.
+
+    With journal, the name of a file, every move is appended to it as it is played,
+    and a game already in the file is resumed."""
+    import json
+    if engine_color:
+        from .engine import Engine, format_result
+        if engine is None:
+            engine = Engine(max_time=2)
     board = ChessBoard()
+    if journal:
+        import os
+        from .savefile import GameJournal
+        journal = GameJournal(journal)
+        if os.path.exists(journal.filename):
+            board = journal.resume()
+        else:
+            journal.attach(board)
     while True:
         board.display()
         print(f"\n{board.current_player}'s turn")
+        status = board.game_status()
+        if status in ('checkmate', 'stalemate'):
+            # A finished game that was loaded or resumed
+            print(f"The game is over ({status}), 'undo', 'load' or 'quit'.")
         
         try:
-            move = input("Enter move (e.g., 'e2 to e4'), 'save', 'load', or 'quit': ").strip()
-            start_pos, end_pos = parse_move(move)
+            promotion = None
+            if board.current_player == engine_color:
+                search = engine.search(board)
+                if search.move is None:
+                    break
+                start_pos, end_pos, promotion = search.move
+                print(f"Engine plays {convert_move_to_notation(search.move)} ({format_result(search)})")
+            else:
+                move = input("Enter move (e.g., 'e2 to e4'), 'undo', 'save', 'load', or 'quit': ").strip()
+                start_pos, end_pos = parse_move(move)
             
-            if start_pos == 'save':
-                filename = input("Enter filename to save: ")
-                save_game(board, filename)
-                print(f"Game saved to {filename}")
-                continue
-            elif start_pos == 'load':
-                filename = input("Enter filename to load: ")
-                board = load_game(filename)
-                print(f"Game loaded from {filename}")
-                continue
-            elif start_pos is None:  # User typed 'quit'
-                break
-                
-            if end_pos is None:
-                # User only entered start position, ask for end position
-                end = input("Enter end position (e.g., 'e4'): ").strip()
-                if end.lower() == 'quit':
+                if start_pos == 'save':
+                    filename = input("Enter filename to save: ")
+                    save_game(board, filename)
+                    print(f"Game saved to {filename}")
+                    continue
+                elif start_pos == 'load':
+                    filename = input("Enter filename to load: ")
+                    board = load_game(filename)
+                    if journal:
+                        journal.attach(board)
+                    print(f"Game loaded from {filename}")
+                    continue
+                elif start_pos == 'undo':
+                    if not board.undo_move():
+                        print("No move to undo.")
+                    elif board.current_player == engine_color:
+                        # Take back the engine's reply too
+                        board.undo_move()
+                    continue
+                elif start_pos is None:  # User typed 'quit'
                     break
-                end_pos = convert_notation_to_index(end)
+                
+                if end_pos is None:
+                    # User only entered start position, ask for end position
+                    end = input("Enter end position (e.g., 'e4'): ").strip()
+                    if end.lower() == 'quit':
+                        break
+                    end_pos = convert_notation_to_index(end)
             
-            result = board.move_piece(start_pos, end_pos)
+            result = board.move_piece(start_pos, end_pos, promotion)
             if result == 'checkmate':
                 start_notation = convert_index_to_notation(start_pos[0], start_pos[1])
                 end_notation = convert_index_to_notation(end_pos[0], end_pos[1])
@@ -1,15 +1,20 @@
 import tkinter as tk
-from PIL import Image, ImageTk
+import tkinter.filedialog
+import tkinter.messagebox
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 import json
 import os
 import pathlib
+import time
 
-from .chess_game import ChessBoard, save_game
+from .chess_game import ChessBoard, save_game, load_game
+from .engine import Engine
+from .sprites import load_sprites
 
 
 class ChessGUI:
-    def __init__(self, root):
+    def __init__(self, root, engine_color=None, engine=None, journal=None):
         self.root = root
         self.root.title("Chess Game")
 
@@ -26,11 +31,37 @@ class ChessGUI:
         self.highlight_color = "#7B61FF"
         self.move_highlight_color = "#AAD26B"
         
-        # Initialize the chess board logic
+        # Milliseconds a moving piece takes to slide to its square, and between two frames
+        self.animation_time = 120
+        self.animation_frame = 15
+        
+        # Initialize the chess board logic, resuming the game in the journal if there is one
         self.chess_board = ChessBoard()
+        self.journal = None
+        if journal:
+            from .savefile import GameJournal
+            self.journal = GameJournal(journal)
+            if os.path.exists(journal):
+                self.chess_board = self.journal.resume()
+            else:
+                self.journal.attach(self.chess_board)
+        
+        # Computer opponent, playing the pieces of engine_color
+        self.engine_color = engine_color
+        if engine_color and engine is None:
+            engine = Engine(max_time=2)
+        self.engine = engine
+        # The engine thinks on a copy of the board in a worker thread, and the Tk loop
+        # polls for its move every poll_interval milliseconds so the window keeps drawing
+        self.executor = ThreadPoolExecutor(max_workers=1) if engine else None
+        self.thinking = None
+        self.poll_interval = 16
         
         # Dictionary to store piece images
         self.piece_images = {}
+        # Canvas image and piece drawn on each occupied square, and the pending animation frame of moving items
+        self.piece_items = {}
+        self.animations = {}
         
         # Create the main frame
         self.main_frame = tk.Frame(root)
@@ -54,6 +85,7 @@ class ChessGUI:
         
         # Create buttons
         tk.Button(self.button_frame, text="New Game", command=self.new_game).pack(side=tk.LEFT, padx=5)
+        tk.Button(self.button_frame, text="Undo", command=self.undo_move).pack(side=tk.LEFT, padx=5)
         tk.Button(self.button_frame, text="Save Game", command=self.save_game).pack(side=tk.LEFT, padx=5)
         tk.Button(self.button_frame, text="Load Game", command=self.load_game).pack(side=tk.LEFT, padx=5)
         
@@ -79,36 +111,13 @@ class ChessGUI:
         
         # Bind mouse events
         self.canvas.bind('<Button-1>', self.on_square_click)
+        self.root.protocol('WM_DELETE_WINDOW', self.close)
+        
+        self.schedule_engine_move()
 
     def create_piece_images(self):
-        # Create colored rectangles as placeholder pieces
-        piece_symbols = {
-            'K': 'king',
-            'Q': 'queen',
-            'R': 'rook',
-            'B': 'bishop',
-            'N': 'knight',
-            'P': 'pawn'
-        }
-
-        current_dir = pathlib.Path(__file__).parent.resolve()
-
-        for color in ['white', 'black']:
-            color_code = 'w' if color == 'white' else 'b'
-            fill_color = '#FFFFFF' if color == 'white' else '#000000'
-            outline_color = '#000000' if color == 'white' else '#FFFFFF'
-            
-            for symbol, name in piece_symbols.items():
-                # if symbol == 'P':
-                    img_path = os.path.join(current_dir, f"pieces/{color_code}{symbol}.png")
-                    img = Image.open(img_path)
-                    img = img.resize((self.SQUARE_SIZE - 10, self.SQUARE_SIZE - 10))
-                    self.piece_images[color + symbol] = ImageTk.PhotoImage(img)
-                # else:
-                #     img = Image.new('RGBA', (self.SQUARE_SIZE - 20, self.SQUARE_SIZE - 20), fill_color)
-                #     # Add piece symbol text
-                #     piece_key = color + symbol
-                #     self.piece_images[piece_key] = ImageTk.PhotoImage(img)
+        # Scaled once per square size and kept in the user cache directory
+        self.piece_images = load_sprites(self.SQUARE_SIZE - 10, self.root)
 
     def draw_board(self):
         self.canvas.delete("squares")
@@ -149,29 +158,74 @@ class ChessGUI:
                         tags="squares"
                     )
 
+    def square_center(self, row, col):
+        return col * self.SQUARE_SIZE + self.SQUARE_SIZE // 2, row * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
+
     def update_pieces(self):
-        self.canvas.delete("pieces")
+        """Bring the canvas in line with the board, creating, changing or deleting
+        only the images of the squares whose piece is not the one drawn there"""
+        board = self.chess_board.board
         for row in range(8):
             for col in range(8):
-                piece = self.chess_board.board[row][col]
-                if piece:
-                    x = col * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-                    y = row * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-                    piece_key = piece.color + piece.symbol
-                    self.canvas.create_image(
-                        x, y,
-                        image=self.piece_images[piece_key],
+                piece = board[row][col]
+                drawn = self.piece_items.get((row, col))
+                # Pieces are shared instances, so an unchanged square holds the very same object
+                if drawn is None and piece is None or drawn is not None and drawn[1] is piece:
+                    continue
+                if drawn is not None:
+                    item = drawn[0]
+                    if piece is None:
+                        self.delete_item(item)
+                        del self.piece_items[(row, col)]
+                        continue
+                    self.canvas.itemconfig(item, image=self.piece_images[piece.color + piece.symbol])
+                else:
+                    item = self.canvas.create_image(
+                        *self.square_center(row, col),
+                        image=self.piece_images[piece.color + piece.symbol],
                         tags="pieces"
                     )
-                    # Add piece symbol text
-                    # symbol_color = '#000000' if piece.color == 'white' else '#FFFFFF'
-                    # self.canvas.create_text(
-                    #     x, y,
-                    #     text=piece.symbol,
-                    #     fill=symbol_color,
-                    #     font=('Arial', 24, 'bold'),
-                    #     tags="pieces"
-                    # )
+                self.piece_items[(row, col)] = (item, piece)
+
+    def show_move(self, start, end):
+        """Slide the image of the piece that just moved from start to end, and the rook when castling,
+        then update the squares left: the captured piece, an en passant victim or a promotion"""
+        moved = self.piece_items.pop(start, None)
+        if moved is not None:
+            captured = self.piece_items.pop(end, None)
+            if captured is not None:
+                self.delete_item(captured[0])
+            self.piece_items[end] = moved
+            self.animate(moved[0], end)
+            if moved[1].symbol == 'K' and abs(end[1] - start[1]) == 2:
+                rook_start, rook_end = ((start[0], 7), (start[0], 5)) if end[1] > start[1] else \
+                    ((start[0], 0), (start[0], 3))
+                rook = self.piece_items.pop(rook_start, None)
+                if rook is not None:
+                    self.piece_items[rook_end] = rook
+                    self.animate(rook[0], rook_end)
+        self.update_pieces()
+
+    def animate(self, item, square, frame=1):
+        # Move item a step closer to the center of square on every frame
+        pending = self.animations.pop(item, None)
+        if pending is not None and frame == 1:
+            self.root.after_cancel(pending)
+        if frame == 1:
+            self.canvas.tag_raise(item)
+        frames = max(1, self.animation_time // self.animation_frame)
+        x, y = self.canvas.coords(item)
+        target_x, target_y = self.square_center(*square)
+        left = frames - frame + 1
+        self.canvas.coords(item, x + (target_x - x) / left, y + (target_y - y) / left)
+        if frame < frames:
+            self.animations[item] = self.root.after(self.animation_frame, self.animate, item, square, frame + 1)
+
+    def delete_item(self, item):
+        pending = self.animations.pop(item, None)
+        if pending is not None:
+            self.root.after_cancel(pending)
+        self.canvas.delete(item)
 
     def highlight_square(self, row, col, color):
         x1 = col * self.SQUARE_SIZE
@@ -208,12 +262,14 @@ class ChessGUI:
 
     def on_square_click(self, event):
         row, col = self.get_square_from_coord(event)
+        if self.chess_board.current_player == self.engine_color:
+            return
         
         if not self.selected_square:
             piece = self.chess_board.board[row][col]
             if piece and piece.color == self.chess_board.current_player:
                 self.selected_square = (row, col)
-                self.valid_moves = piece.valid_moves(self.chess_board, (row, col))
+                self.valid_moves = self.chess_board.piece_moves((row, col))
                 self.clear_highlights()
                 self.highlight_square(row, col, self.highlight_color)
                 self.highlight_moves(self.valid_moves)
@@ -222,63 +278,144 @@ class ChessGUI:
             if (row, col) in self.valid_moves:
                 result = self.chess_board.move_piece(self.selected_square, (row, col))
                 self.clear_highlights()
-                self.update_pieces()
-                
-                if result == 'checkmate':
-                    winner = 'White' if self.chess_board.current_player == 'black' else 'Black'
-                    self.status_label.config(text=f"Checkmate! {winner} wins!")
-                elif result == 'stalemate':
-                    self.status_label.config(text="Stalemate! Game is a draw!")
-                elif result == 'check':
-                    self.status_label.config(text=f"{self.chess_board.current_player.capitalize()}'s turn - Check!")
-                elif result:
-                    self.status_label.config(text=f"{self.chess_board.current_player.capitalize()}'s turn")
+                self.show_move(self.selected_square, (row, col))
+                self.show_result(result)
+                if result in (True, 'check'):
+                    self.schedule_engine_move()
             
             self.selected_square = None
             self.valid_moves = []
             self.clear_highlights()
-            
-        self.root.update()
+
+    def show_result(self, result):
+        if result == 'checkmate':
+            winner = 'White' if self.chess_board.current_player == 'black' else 'Black'
+            self.status_label.config(text=f"Checkmate! {winner} wins!")
+        elif result == 'stalemate':
+            self.status_label.config(text="Stalemate! Game is a draw!")
+        elif result == 'check':
+            self.status_label.config(text=f"{self.chess_board.current_player.capitalize()}'s turn - Check!")
+        elif result:
+            # True after a move, 'playing' from game_status
+            self.status_label.config(text=f"{self.chess_board.current_player.capitalize()}'s turn")
+
+    def schedule_engine_move(self):
+        """Start the engine thinking when it is its turn"""
+        if self.engine and self.chess_board.current_player == self.engine_color and self.thinking is None:
+            self.thinking = self.executor.submit(self.engine.search, self.chess_board.copy())
+            self.canvas.config(cursor='watch')
+            self.root.after(self.poll_interval, self.poll_engine, self.thinking)
+
+    def poll_engine(self, thinking):
+        # A search cancelled by a new game, an undo or a load is no longer the one awaited
+        if thinking is not self.thinking:
+            return
+        if not thinking.done():
+            dots = '.' * (int(time.perf_counter() * 3) % 4)
+            self.status_label.config(text=f"{self.engine_color.capitalize()} is thinking{dots}")
+            self.root.after(self.poll_interval, self.poll_engine, thinking)
+            return
+        self.thinking = None
+        self.canvas.config(cursor='')
+        try:
+            search = thinking.result()
+        except Exception as e:
+            self.status_label.config(text=f"The engine failed: {e}")
+            return
+        if search.move is None:
+            return
+        result = self.chess_board.move_piece(*search.move)
+        self.show_move(search.move.start, search.move.end)
+        self.show_result(result)
+
+    def cancel_engine(self):
+        """Stop the engine thinking and forget its move"""
+        if self.thinking is not None:
+            # A stop after the search returned would cut the next one short
+            if not self.thinking.cancel() and not self.thinking.done():
+                self.engine.stop()
+            self.thinking = None
+            self.canvas.config(cursor='')
+
+    def close(self):
+        self.cancel_engine()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.root.destroy()
 
     def new_game(self):
+        self.cancel_engine()
         self.chess_board = ChessBoard()
+        if self.journal:
+            self.journal.attach(self.chess_board)
         self.selected_square = None
         self.valid_moves = []
         self.clear_highlights()
         self.update_pieces()
         self.status_label.config(text="White's turn")
+        if self.engine:
+            # After the search being stopped, which may still be running
+            self.executor.submit(self.engine.new_game)
+        self.schedule_engine_move()
+
+    def undo_move(self):
+        self.cancel_engine()
+        if self.chess_board.undo_move():
+            if self.chess_board.current_player == self.engine_color:
+                # Take back the engine's reply too
+                self.chess_board.undo_move()
+            self.selected_square = None
+            self.valid_moves = []
+            self.clear_highlights()
+            self.update_pieces()
+            self.show_result(self.chess_board.game_status())
+        # Think again if the engine was interrupted with nothing to take back
+        self.schedule_engine_move()
 
     def save_game(self):
         filename = tk.filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("JSON files", "*.json"), ("Binary chess files", "*.chess"), ("All files", "*.*")]
         )
         if filename:
             save_game(self.chess_board, filename)
 
     def load_game(self):
         filename = tk.filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("JSON files", "*.json"), ("Binary chess files", "*.chess"), ("All files", "*.*")]
         )
         if filename:
             try:
-                self.chess_board = load_game(filename)
+                board = load_game(filename)
+                self.cancel_engine()
+                self.chess_board = board
+                if self.journal:
+                    self.journal.attach(self.chess_board)
                 self.selected_square = None
                 self.valid_moves = []
                 self.clear_highlights()
                 self.update_pieces()
-                self.status_label.config(text=f"{self.chess_board.current_player.capitalize()}'s turn")
+                self.show_result(self.chess_board.game_status())
+                self.schedule_engine_move()
             except Exception as e:
                 tk.messagebox.showerror("Error", f"Failed to load game: {str(e)}")
 
-def play_chess_gui():
+def play_chess_gui(engine_color=None, engine=None, journal=None, first_frame=False):
+    """Open the game window, playing against the computer when engine_color is 'white' or 'black'
+    and appending the moves to the journal file if one is given.
+
+    With first_frame the window is closed as soon as it has been drawn, to time the startup."""
     root = tk.Tk()
     root.resizable(False, False)
     icon_file = 'chess.ico'
     current_dir = pathlib.Path(__file__).parent.resolve()
     icon_path = os.path.join(current_dir, icon_file)
     root.iconbitmap(default=icon_path)
-    gui = ChessGUI(root)
+    gui = ChessGUI(root, engine_color, engine, journal)
+    if first_frame:
+        root.update()
+        root.destroy()
+        return
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+import random
+import time
+from collections import namedtuple
+
+from .chess_game import convert_move_to_notation
+from .evaluation import evaluate, evaluate_full
+from .ordering import MoveOrderer, MAX_PLY
+
+__all__ = ['Engine', 'SearchResult', 'TranspositionTable', 'MATE_SCORE', 'format_result']
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+
+# Transposition table bound types
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Half width of the aspiration window around the previous iteration's score
+ASPIRATION_WINDOW = 50
+
+SearchResult = namedtuple('SearchResult', ['move', 'score', 'pv', 'depth', 'nodes', 'seconds', 'nps'])
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the node or time budget runs out or stop is called"""
+
+
+class TranspositionTable:
+    """Fixed-size table of search results indexed by the low bits of the Zobrist key"""
+
+    def __init__(self, bits=20):
+        self.size = 1 << bits
+        self.entries = [None] * self.size
+
+    def clear(self):
+        self.entries = [None] * self.size
+
+    def probe(self, key):
+        """Return (depth, score, flag, move) stored for the key, or None"""
+        entry = self.entries[key & (self.size - 1)]
+        if entry is not None and entry[0] == key:
+            return entry[1:]
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        self.entries[key & (self.size - 1)] = (key, depth, score, flag, move)
+
+
+class Engine:
+    """Computer player using negamax alpha-beta search with iterative deepening,
+    aspiration windows and a transposition table.
+
+    The search drives a ChessBoard directly with push and pop, and leaves it as it found it.
+    A table can be given to share it between engines, and a seed shuffles the order
+    in which quiet moves are tried so that engines sharing a table search differently.
+    ordering is the MoveOrderer to use, by default one with every heuristic.
+    Positions found in book, an OpeningBook, are played from it without searching,
+    picking the most played move with book_best and a weighted random one otherwise.
+    At the horizon a quiescence search resolves the captures still pending, unless
+    quiescence is false. With debug, every leaf evaluation is checked against one computed from scratch.
+    """
+
+    def __init__(self, max_depth=None, max_nodes=None, max_time=None, table=None, seed=None,
+                 ordering=None, quiescence=True, book=None, book_best=False, debug=False):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.table = table if table is not None else TranspositionTable()
+        self.ordering = ordering or MoveOrderer(random=random.Random(seed) if seed is not None else None)
+        self.quiescence = quiescence
+        self.book = book
+        self.book_best = book_best
+        self.debug = debug
+        self.stop_event = None
+        self.nodes = 0
+        self.stopped = False
+
+    def new_game(self):
+        """Forget everything learned from previous searches"""
+        self.table.clear()
+        self.ordering.clear()
+
+    def stop(self):
+        """Ask a running search to return its best move as soon as possible.
+
+        A stop made just before the search starts still stops it, the request is only
+        cleared when the search returns."""
+        self.stopped = True
+
+    def search(self, board, max_depth=None, max_nodes=None, max_time=None, callback=None,
+               start_depth=1, stop_event=None):
+        """Search the position for the player to move and return a SearchResult.
+
+        Limits default to the ones given to the engine; with none at all the search
+        runs to depth 4. callback, if given, receives the result of every completed depth.
+        start_depth skips the first iterations and stop_event, a threading or
+        multiprocessing Event, stops the search when set.
+        """
+        try:
+            return self.iterative_deepening(board, max_depth, max_nodes, max_time, callback,
+                                            start_depth, stop_event)
+        finally:
+            self.stopped = False
+
+    def iterative_deepening(self, board, max_depth, max_nodes, max_time, callback, start_depth, stop_event):
+        max_depth = max_depth or self.max_depth or (MAX_PLY if max_nodes or max_time or
+                                                    self.max_nodes or self.max_time else 4)
+        self.node_limit = max_nodes or self.max_nodes
+        max_time = max_time or self.max_time
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + max_time if max_time else None
+        self.nodes = 0
+        self.stop_event = stop_event
+        result = book_result(self.book, board, self.book_best)
+        if result is not None:
+            return result
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.root_depth = len(board.undo_stack)
+        self.ordering.new_search()
+
+        moves = list(board.cached_legal_moves())
+        if not moves:
+            score = -MATE_SCORE if board.is_in_check(board.current_player) else 0
+            return SearchResult(None, score, [], 0, 0, 0.0, 0)
+        result = SearchResult(moves[0], 0, [moves[0]], 0, 0, 0.0, 0)
+
+        score = 0
+        for depth in range(min(start_depth, max_depth), min(max_depth, MAX_PLY) + 1):
+            try:
+                if depth >= 3:
+                    alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+                    score = self.negamax(board, depth, alpha, beta, 0)
+                    if score <= alpha or score >= beta:
+                        # Outside the window, search again with the full one
+                        score = self.negamax(board, depth, -INFINITY, INFINITY, 0)
+                else:
+                    score = self.negamax(board, depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                # Take back the moves of the interrupted search
+                while len(board.undo_stack) > self.root_depth:
+                    board.pop()
+                break
+            seconds = time.perf_counter() - self.start_time
+            result = SearchResult(self.pv[0][0] if self.pv[0] else result.move, score, list(self.pv[0]),
+                                  depth, self.nodes, seconds, int(self.nodes / seconds) if seconds else 0)
+            if callback:
+                callback(result)
+            if abs(score) >= MATE_SCORE - MAX_PLY:
+                break
+
+        # Report the work of an interrupted iteration too
+        seconds = time.perf_counter() - self.start_time
+        return result._replace(nodes=self.nodes, seconds=seconds,
+                               nps=int(self.nodes / seconds) if seconds else 0)
+
+    def check_limits(self):
+        if self.node_limit and self.nodes >= self.node_limit:
+            self.stopped = True
+        elif self.deadline and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        elif self.stop_event is not None and self.stop_event.is_set():
+            self.stopped = True
+
+    def negamax(self, board, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+        if self.stopped:
+            raise SearchAborted
+        self.pv[ply] = []
+
+        if ply > 0 and is_repetition(board):
+            return 0
+
+        key = board.zobrist_key
+        entry = self.table.probe(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, entry_score, flag, tt_move = entry
+            if ply > 0 and entry_depth >= depth:
+                entry_score = score_from_table(entry_score, ply)
+                if flag == EXACT or (flag == LOWER and entry_score >= beta) or \
+                        (flag == UPPER and entry_score <= alpha):
+                    return entry_score
+
+        if depth <= 0 or ply >= MAX_PLY:
+            if self.quiescence:
+                return self.quiesce(board, alpha, beta, ply)
+            return self.evaluate(board)
+
+        moves = list(board.legal_moves())
+        if not moves:
+            return -MATE_SCORE + ply if board.is_in_check(board.current_player) else 0
+        self.ordering.order(board, moves, ply, tt_move)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for move in moves:
+            board.push(move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        self.ordering.cutoff(board, move, ply, depth)
+                        break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(key, depth, score_to_table(best_score, ply), flag, best_move)
+        return best_score
+
+
+    def quiesce(self, board, alpha, beta, ply):
+        # Search captures and queen promotions only, until the position is quiet
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+        if self.stopped:
+            raise SearchAborted
+        self.pv[ply] = []
+        # The tables end here, even for evasions
+        if ply >= MAX_PLY:
+            return self.evaluate(board)
+
+        in_check = board.is_in_check(board.current_player)
+        if in_check:
+            # No standing pat in check, every evasion is tried
+            best_score = -MATE_SCORE + ply
+            moves = self.ordering.order(board, list(board.legal_moves()), ply)
+        else:
+            best_score = self.evaluate(board)
+            if best_score >= beta:
+                return best_score
+            alpha = max(alpha, best_score)
+            moves = [move for move in board.legal_moves() if is_tactical(board, move)]
+            self.ordering.order_captures(board, moves)
+
+        for move in moves:
+            # Skip captures that lose material without making them
+            if not in_check and move.promotion is None and board.see(move.start, move.end) < 0:
+                continue
+            board.push(move)
+            score = -self.quiesce(board, -beta, -alpha, ply + 1)
+            board.pop()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def evaluate(self, board):
+        score = evaluate(board)
+        if self.debug and score != evaluate_full(board):
+            raise AssertionError(f"incremental evaluation {score} differs from {evaluate_full(board)} "
+                                 f"after {' '.join(convert_move_to_notation(r[:2]) for r in board.undo_stack)}")
+        return score
+
+
+def book_result(book, board, best=False):
+    """Return a SearchResult for a book move in the position, or None when there is none"""
+    if book is None:
+        return None
+    move = board.book_move(book, best)
+    if move is None:
+        return None
+    return SearchResult(move, 0, [move], 0, 0, 0.0, 0)
+
+
+def is_tactical(board, move):
+    """Whether the move is a capture or a queen promotion, the moves searched by quiescence"""
+    if move.promotion is not None:
+        return move.promotion == 'Q'
+    if board.board[move.end[0]][move.end[1]] is not None:
+        return True
+    # En passant
+    return move.start[1] != move.end[1] and board.board[move.start[0]][move.start[1]].symbol == 'P'
+
+
+def is_repetition(board):
+    """Whether the position already occurred since the last capture or pawn move"""
+    key = board.zobrist_key
+    for record in reversed(board.undo_stack):
+        piece, captured, previous_key = record[2], record[4], record[10]
+        if piece.symbol == 'P' or captured is not None:
+            return False
+        if previous_key == key:
+            return True
+    return False
+
+
+def score_to_table(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def format_result(result):
+    """Describe a search result in one line"""
+    if result.depth == 0 and result.move is not None:
+        return f"book move {convert_move_to_notation(result.move)}"
+    if abs(result.score) >= MATE_SCORE - MAX_PLY:
+        moves = (MATE_SCORE - abs(result.score) + 1) // 2
+        score = f"mate {moves if result.score > 0 else -moves}"
+    else:
+        score = f"{result.score / 100:+.2f}"
+    pv = ' '.join(convert_move_to_notation(move) for move in result.pv)
+    return (f"depth {result.depth} score {score} nodes {result.nodes} "
+            f"nps {result.nps} time {result.seconds:.2f}s pv {pv}")
@@ -0,0 +1,150 @@
+__all__ = ['PIECE_VALUES', 'PIECE_SQUARE_TABLES', 'ENDGAME_PIECE_VALUES', 'ENDGAME_SQUARE_TABLES',
+           'SEE_VALUES', 'evaluate', 'evaluate_full']
+
+# Material values in centipawns
+PIECE_VALUES = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+# Piece-square tables from white's point of view, indexed by row * 8 + col with
+# row 0 being the 8th rank; black uses the same tables mirrored vertically
+PIECE_SQUARE_TABLES = {
+    'P': [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    'N': [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    'B': [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    'R': [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    'Q': [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    'K': [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+# Values used to resolve exchanges, where the king is worth more than anything it can take
+SEE_VALUES = dict(PIECE_VALUES, K=20000)
+
+# Endgame material values and the tables that differ from the middlegame ones:
+# pawns are worth more the closer they are to promotion and the king heads for the center
+ENDGAME_PIECE_VALUES = {'P': 120, 'N': 300, 'B': 320, 'R': 520, 'Q': 940, 'K': 0}
+ENDGAME_SQUARE_TABLES = dict(PIECE_SQUARE_TABLES, **{
+    'P': [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        80, 80, 80, 80, 80, 80, 80, 80,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        30, 30, 30, 30, 30, 30, 30, 30,
+        15, 15, 15, 15, 15, 15, 15, 15,
+        5, 5, 5, 5, 5, 5, 5, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    'K': [
+        -50, -40, -30, -20, -20, -30, -40, -50,
+        -30, -20, -10, 0, 0, -10, -20, -30,
+        -30, -10, 20, 30, 30, 20, -10, -30,
+        -30, -10, 30, 40, 40, 30, -10, -30,
+        -30, -10, 30, 40, 40, 30, -10, -30,
+        -30, -10, 20, 30, 30, 20, -10, -30,
+        -30, -30, 0, 0, 0, 0, -30, -30,
+        -50, -30, -30, -30, -30, -30, -30, -50,
+    ],
+})
+
+# Contribution of each piece to the game phase, which goes from 24 with all
+# the pieces on the board down to 0 when only kings and pawns are left
+PHASE_WEIGHTS = {'P': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+TOTAL_PHASE = 24
+
+
+def square_scores(values, tables):
+    # Signed value of every piece on every square, positive for white, by color, symbol and row * 8 + col
+    return {
+        'white': {symbol: [values[symbol] + table[sq] for sq in range(64)]
+                  for symbol, table in tables.items()},
+        'black': {symbol: [-values[symbol] - table[(7 - sq // 8) * 8 + sq % 8] for sq in range(64)]
+                  for symbol, table in tables.items()},
+    }
+
+
+MIDGAME_SCORES = square_scores(PIECE_VALUES, PIECE_SQUARE_TABLES)
+ENDGAME_SCORES = square_scores(ENDGAME_PIECE_VALUES, ENDGAME_SQUARE_TABLES)
+
+
+def compute_scores(board):
+    """Sum the middlegame and endgame scores and the phase of the position from scratch"""
+    midgame = endgame = phase = 0
+    for i in range(8):
+        for j in range(8):
+            piece = board.board[i][j]
+            if piece:
+                midgame += MIDGAME_SCORES[piece.color][piece.symbol][i * 8 + j]
+                endgame += ENDGAME_SCORES[piece.color][piece.symbol][i * 8 + j]
+                phase += PHASE_WEIGHTS[piece.symbol]
+    return midgame, endgame, phase
+
+
+def tapered_score(scores, player):
+    # Blend the middlegame and endgame scores by the phase, from the point of view of player
+    midgame, endgame, phase = scores
+    phase = min(phase, TOTAL_PHASE)
+    score = (midgame * phase + endgame * (TOTAL_PHASE - phase)) // TOTAL_PHASE
+    return score if player == 'white' else -score
+
+
+def evaluate(board):
+    """Return the static score of the position in centipawns from the point of view of the player to move,
+    using the scores the board keeps up to date on every move"""
+    return tapered_score(board.scores, board.current_player)
+
+
+def evaluate_full(board):
+    """Like evaluate but rescanning the board, to cross-check the incremental scores"""
+    return tapered_score(compute_scores(board), board.current_player)
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+__all__ = ['play_game', 'run_load', 'percentile', 'main']
+
+
+def percentile(values, fraction):
+    """The value below which the given fraction of the sorted values fall"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def request(reader, writer, message):
+    """Send a request and return its reply, skipping the events sent in between"""
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+    while True:
+        reply = json.loads(await reader.readline())
+        if 'event' not in reply:
+            return reply
+
+
+async def play_game(host, port, moves, engine_color, movetime, rng, latencies):
+    """Play a game of random moves on the server, adding the seconds of each move request to latencies.
+
+    Without engine_color the client plays both sides, as two people would. Returns (moves, errors)."""
+    reader, writer = await asyncio.open_connection(host, port)
+    played = errors = 0
+    try:
+        state = await request(reader, writer, {'op': 'new', 'engine': engine_color, 'movetime': movetime})
+        while played < moves and state.get('legal') and state['status'] not in ('checkmate', 'stalemate'):
+            start = time.perf_counter()
+            reply = await request(reader, writer, {'op': 'move', 'game': state['game'],
+                                                   'move': rng.choice(state['legal'])})
+            latencies.append(time.perf_counter() - start)
+            if 'error' in reply:
+                errors += 1
+                break
+            played += 1
+            state = reply
+    finally:
+        writer.close()
+    return played, errors
+
+
+async def run_load(host, port, games, moves, engine_games=0, movetime=0.1, seed=None):
+    """Play games at once, engine_games of them against the engine, and return a report dict"""
+    rng = random.Random(seed)
+    human, engine = [], []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        play_game(host, port, moves, 'black' if index < engine_games else None, movetime,
+                  random.Random(rng.random()), engine if index < engine_games else human)
+        for index in range(games)))
+    seconds = time.perf_counter() - start
+    played = sum(result[0] for result in results)
+    report = {
+        'games': games,
+        'engine_games': engine_games,
+        'moves': played,
+        'errors': sum(result[1] for result in results),
+        'seconds': round(seconds, 6),
+        'moves_per_second': int(played / seconds) if seconds else None,
+    }
+    for name, latencies in (('move', human), ('engine', engine)):
+        if latencies:
+            report[f'{name}_p50_ms'] = round(percentile(latencies, 0.50) * 1000, 3)
+            report[f'{name}_p99_ms'] = round(percentile(latencies, 0.99) * 1000, 3)
+            report[f'{name}_mean_ms'] = round(statistics.mean(latencies) * 1000, 3)
+    return report
+
+
+def start_server(host, workers, save_dir, movetime):
+    """Start python -m chess.server on host and any free port and return the process and the port"""
+    arguments = [sys.executable, '-m', 'chess.server', '--host', host, '--port', '0', '--movetime', str(movetime)]
+    if workers:
+        arguments += ['--workers', str(workers)]
+    if save_dir:
+        arguments += ['--save-dir', save_dir]
+    process = subprocess.Popen(arguments, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError("The server did not start")
+    return process, json.loads(line)['port']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.loadtest',
+        description='Play many games at once against python -m chess.server and print the p50 and p99 '
+                    'latency of move requests as JSON. Without --port a server is started for the run.')
+    parser.add_argument('--games', type=int, nargs='+', default=[10, 100],
+                        help='concurrent games, one report per count (default: 10 100)')
+    parser.add_argument('--moves', type=int, default=40, help='moves played by the client per game (default: 40)')
+    parser.add_argument('--engine-games', type=int, default=0,
+                        help='games of each run played against the engine (default: 0)')
+    parser.add_argument('--movetime', type=float, default=0.05,
+                        help='seconds the engine thinks per move (default: 0.05)')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='server address, which the started server listens on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=None, help='port of a running server')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes of the started server')
+    parser.add_argument('--no-save', action='store_true', help='do not save the games of the started server')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random moves')
+    args = parser.parse_args(argv)
+
+    process = None
+    save_dir = tempfile.TemporaryDirectory()
+    port = args.port
+    try:
+        if port is None:
+            process, port = start_server(args.host, args.workers, None if args.no_save else save_dir.name,
+                                         args.movetime)
+        for games in args.games:
+            report = asyncio.run(run_load(args.host, port, games, args.moves,
+                                          min(args.engine_games, games), args.movetime, args.seed))
+            print(json.dumps(report), flush=True)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        save_dir.cleanup()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import argparse
+import json
+import sys
+
+from .chess_game import ChessBoard, convert_move_to_notation
+from .evaluation import PIECE_VALUES
+
+__all__ = ['MoveOrderer', 'main']
+
+MAX_PLY = 128
+
+# Scores that keep the move classes apart: transposition table move, captures and
+# queen promotions, the two killers, then quiet moves by history
+TT_MOVE_SCORE = 1 << 40
+CAPTURE_SCORE = 1 << 32
+KILLER_SCORES = (1 << 31, (1 << 31) - 1)
+
+# Rank of the capturing piece, cheaper attackers are tried first
+ATTACKER_RANKS = {'P': 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5}
+
+# History scores are halved once one of them gets this large
+HISTORY_LIMIT = 1 << 24
+
+
+class MoveOrderer:
+    """Sort moves so that the ones most likely to cause a cutoff are searched first.
+
+    Captures are tried by most valuable victim, least valuable attacker; quiet moves
+    that refuted another move at the same ply (killers) come next, and the rest by
+    how often they caused cutoffs before (the history table, indexed by start and end square).
+    Every heuristic can be switched off in the main search, to measure what it is worth;
+    order_captures always sorts by MVV-LVA, so that quiescence stays small either way.
+    A random number generator, if given, breaks ties between quiet moves randomly.
+    """
+
+    def __init__(self, tt_move=True, mvv_lva=True, killers=True, history=True, random=None):
+        self.use_tt_move = tt_move
+        self.use_mvv_lva = mvv_lva
+        self.use_killers = killers
+        self.use_history = history
+        self.random = random
+        self.clear()
+
+    def clear(self):
+        """Forget the killers and history"""
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.history = [0] * 4096
+
+    def new_search(self):
+        """Keep what was learned in previous searches, but with less weight"""
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.history = [score >> 1 for score in self.history]
+
+    def score(self, board, move, ply=0, tt_move=None):
+        """Return a score for the move, higher for the moves to try first"""
+        if self.use_tt_move and move == tt_move:
+            return TT_MOVE_SCORE
+        (start_x, start_y), (end_x, end_y) = move[0], move[1]
+        if self.use_mvv_lva:
+            score = mvv_lva(board, move)
+            if score is not None:
+                return CAPTURE_SCORE + score
+        if self.use_killers:
+            killers = self.killers[ply]
+            if move == killers[0]:
+                return KILLER_SCORES[0]
+            if move == killers[1]:
+                return KILLER_SCORES[1]
+        score = self.history[(start_x * 8 + start_y) * 64 + end_x * 8 + end_y] if self.use_history else 0
+        return score + self.random.random() if self.random else score
+
+    def order(self, board, moves, ply=0, tt_move=None):
+        """Sort a list of moves of the player to move in place, best first, and return it"""
+        moves.sort(key=lambda move: self.score(board, move, ply, tt_move), reverse=True)
+        return moves
+
+    def order_captures(self, board, moves):
+        """Sort captures and queen promotions in place by MVV-LVA, whatever heuristics are on, and return them"""
+        moves.sort(key=lambda move: mvv_lva(board, move) or 0, reverse=True)
+        return moves
+
+    def cutoff(self, board, move, ply, depth):
+        """Record that move caused a beta cutoff at ply with depth left to search"""
+        (start_x, start_y), (end_x, end_y) = move[0], move[1]
+        if board.board[end_x][end_y] is not None or (len(move) > 2 and move[2]):
+            return
+        piece = board.board[start_x][start_y]
+        if piece is not None and piece.symbol == 'P' and start_y != end_y:
+            return
+        if self.use_killers:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        if self.use_history:
+            index = (start_x * 8 + start_y) * 64 + end_x * 8 + end_y
+            self.history[index] += depth * depth
+            if self.history[index] >= HISTORY_LIMIT:
+                self.history = [score >> 1 for score in self.history]
+
+
+def mvv_lva(board, move):
+    """Score a capture or queen promotion by most valuable victim, least valuable attacker;
+    None for other moves"""
+    (start_x, start_y), (end_x, end_y) = move[0], move[1]
+    victim = board.board[end_x][end_y]
+    piece = board.board[start_x][start_y]
+    if victim is None and piece.symbol == 'P' and start_y != end_y:
+        victim = piece  # en passant
+    if victim is not None:
+        return PIECE_VALUES[victim.symbol] * 8 - ATTACKER_RANKS[piece.symbol]
+    if len(move) > 2 and move[2] == 'Q':
+        return PIECE_VALUES['Q'] * 8
+    return None
+
+
+# Orderings compared by the benchmark, each adding one heuristic to the previous one.
+# They only change the main search, quiescence orders its captures by MVV-LVA in all of them
+ORDERINGS = [
+    ('none', dict(tt_move=False, mvv_lva=False, killers=False, history=False)),
+    ('tt-move', dict(tt_move=True, mvv_lva=False, killers=False, history=False)),
+    ('mvv-lva', dict(tt_move=True, mvv_lva=True, killers=False, history=False)),
+    ('killers', dict(tt_move=True, mvv_lva=True, killers=True, history=False)),
+    ('history', dict(tt_move=True, mvv_lva=True, killers=True, history=True)),
+]
+
+
+def main(argv=None):
+    from .engine import Engine
+    from .smp import BENCHMARK_POSITIONS
+
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.ordering',
+        description='Count the nodes searched to a fixed depth with more and more move ordering heuristics '
+                    'and print one JSON object per line, with the effective branching factor.')
+    parser.add_argument('--depth', type=int, default=4, help='search depth (default: 4)')
+    parser.add_argument('--position', action='append', choices=[name for name, _ in BENCHMARK_POSITIONS],
+                        help='only run the named benchmark position, can be repeated')
+    parser.add_argument('--fen', help='run a custom position instead of the benchmark ones')
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = [('fen', args.fen)]
+    else:
+        positions = [position for position in BENCHMARK_POSITIONS
+                     if not args.position or position[0] in args.position]
+
+    totals = {name: 0 for name, _ in ORDERINGS}
+    for position, fen in positions:
+        for name, options in ORDERINGS:
+            board = ChessBoard.from_fen(fen)
+            engine = Engine(ordering=MoveOrderer(**options))
+            iterations = []
+            result = engine.search(board, max_depth=args.depth, callback=iterations.append)
+            totals[name] += result.nodes
+            # Effective branching factor: growth of the tree from one iteration to the next,
+            # none when the game is already over and nothing was searched
+            ebf = None
+            if iterations:
+                last, previous = iterations[-1].nodes, iterations[-2].nodes if len(iterations) > 1 else 1
+                ebf = round(last / max(previous, 1), 2)
+            print(json.dumps({
+                'position': position,
+                'ordering': name,
+                'depth': result.depth,
+                'move': convert_move_to_notation(result.move) if result.move else None,
+                'nodes': result.nodes,
+                'ebf': ebf,
+                'seconds': round(result.seconds, 6),
+            }), flush=True)
+
+    baseline = totals[ORDERINGS[0][0]]
+    for name, nodes in totals.items():
+        print(json.dumps({'position': 'total', 'ordering': name, 'nodes': nodes,
+                          'reduction': round(1 - nodes / baseline, 3) if baseline else None}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
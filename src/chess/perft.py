@@ -0,0 +1,122 @@
+import argparse
+import json
+import sys
+import time
+
+from .chess_game import ChessBoard, convert_move_to_notation
+from .bitboard import BitboardChessBoard
+
+__all__ = ['POSITIONS', 'run_perft', 'main']
+
+BACKENDS = {'list': ChessBoard, 'bitboard': BitboardChessBoard}
+
+# Reference positions with their known node counts, starting at depth 1
+POSITIONS = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603, 193690690]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333, 15833292]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487, 89941194]),
+    # En passant
+    ('illegal-ep-1', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1',
+     [18, 92, 1670, 10138, 185429, 1134888]),
+    ('illegal-ep-2', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1',
+     [13, 102, 1266, 10276, 135655, 1015133]),
+    ('ep-capture-checks', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1',
+     [15, 126, 1928, 13931, 206379, 1440467]),
+    # Castling
+    ('short-castling-check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1',
+     [15, 66, 1198, 6399, 120330, 661072]),
+    ('long-castling-check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1',
+     [16, 71, 1286, 7418, 141077, 803711]),
+    ('castling-rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1',
+     [26, 1141, 27826, 1274206]),
+    ('castling-prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1',
+     [44, 1494, 50509, 1720476]),
+    # Promotions, checks and stalemates
+    ('promote-out-of-check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1',
+     [11, 133, 1442, 19174, 266199, 3821001]),
+    ('discovered-check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1',
+     [29, 165, 5160, 31961, 1004658]),
+    ('promote-to-check', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1',
+     [9, 40, 472, 2661, 38983, 217342]),
+    ('underpromote-to-check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1',
+     [6, 27, 273, 1329, 18135, 92683]),
+    ('self-stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1',
+     [2, 6, 13, 63, 382, 2217]),
+    ('stalemate-checkmate', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1',
+     [10, 25, 268, 926, 10857, 43261, 567584]),
+    ('double-check', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1',
+     [37, 183, 6559, 23527]),
+]
+
+
+def run_perft(positions, max_depth, board_class=ChessBoard):
+    """Run perft on every position up to max_depth and yield one result per position and depth"""
+    for name, fen, expected in positions:
+        board = board_class.from_fen(fen)
+        depths = len(expected) if expected else max_depth
+        for depth in range(1, min(max_depth, depths) + 1):
+            start = time.perf_counter()
+            nodes = board.perft(depth)
+            seconds = time.perf_counter() - start
+            result = {
+                'position': name,
+                'depth': depth,
+                'nodes': nodes,
+                'seconds': round(seconds, 6),
+                'nps': int(nodes / seconds) if seconds else None,
+            }
+            if expected:
+                result['expected'] = expected[depth - 1]
+                result['ok'] = nodes == expected[depth - 1]
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.perft',
+        description='Count move generation nodes on reference positions and print one JSON object per line.')
+    parser.add_argument('--depth', type=int, default=3, help='maximum depth to search (default: 3)')
+    parser.add_argument('--position', action='append', choices=[name for name, _, _ in POSITIONS],
+                        help='only run the named reference position, can be repeated')
+    parser.add_argument('--fen', help='run a custom position instead of the reference ones')
+    parser.add_argument('--divide', action='store_true',
+                        help='print the node count below each move at the given depth')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='list',
+                        help='board implementation to use (default: list)')
+    args = parser.parse_args(argv)
+    board_class = BACKENDS[args.backend]
+
+    if args.fen:
+        positions = [('fen', args.fen, None)]
+    else:
+        positions = [position for position in POSITIONS
+                     if not args.position or position[0] in args.position]
+
+    if args.divide:
+        for name, fen, _ in positions:
+            board = board_class.from_fen(fen)
+            start = time.perf_counter()
+            counts = board.divide(args.depth)
+            seconds = time.perf_counter() - start
+            for move, nodes in counts.items():
+                print(json.dumps({'position': name, 'move': convert_move_to_notation(move), 'nodes': nodes}))
+            print(json.dumps({'position': name, 'depth': args.depth, 'nodes': sum(counts.values()),
+                              'seconds': round(seconds, 6)}))
+        return 0
+
+    failed = False
+    for result in run_perft(positions, args.depth, board_class):
+        print(json.dumps(result), flush=True)
+        failed = failed or result.get('ok') is False
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+
+from .chess_game import ChessBoard, Move, STARTING_FEN, convert_notation_to_index, convert_index_to_notation
+from .bitboard import BitboardChessBoard
+
+__all__ = ['PGNGame', 'read_games', 'split_games', 'parse_game', 'parse_san', 'move_to_san',
+           'write_game', 'game_to_pgn', 'validate_games', 'main']
+
+BACKENDS = {'list': ChessBoard, 'bitboard': BitboardChessBoard}
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, variations, numeric annotations and move numbers are dropped from the move text
+MOVETEXT = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|\d+\.+|(1-0|0-1|1/2-1/2|\*)|([^\s(){};]+)|([()])')
+SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBNqrbn]))?[+#]?[!?]*$')
+CASTLING = re.compile(r'^([O0]-[O0](-[O0])?)[+#]?[!?]*$')
+
+
+class PGNGame:
+    """A game read from PGN: its tags, its moves in SAN and its result"""
+
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+
+    def board(self, board_class=ChessBoard):
+        """Return a board with the starting position of the game"""
+        return board_class.from_fen(self.headers.get('FEN', STARTING_FEN))
+
+    def replay(self, board_class=ChessBoard):
+        """Yield (board, san, move) for every move, with the move already played on the board.
+
+        Raises ValueError on the first move that is not legal."""
+        board = self.board(board_class)
+        for san in self.moves:
+            move = parse_san(board, san)
+            board.push(move)
+            yield board, san, move
+
+    def __repr__(self):
+        return f"PGNGame({self.headers.get('White', '?')} - {self.headers.get('Black', '?')}, {len(self.moves)} moves)"
+
+
+def split_games(source):
+    """Yield the text of every game of a PGN file or path, reading it one line at a time"""
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', errors='replace') as file:
+            yield from split_games(file)
+        return
+    lines = []
+    in_moves = False
+    for line in source:
+        stripped = line.strip()
+        if stripped.startswith('[') and in_moves:
+            # A tag after the move text starts the next game
+            yield ''.join(lines)
+            lines = []
+            in_moves = False
+        elif stripped and not stripped.startswith('[') and not stripped.startswith('%'):
+            in_moves = True
+        lines.append(line)
+    if any(line.strip() for line in lines):
+        yield ''.join(lines)
+
+
+def parse_game(text):
+    """Parse the text of one game into a PGNGame"""
+    game = PGNGame()
+    body = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('[') and not body:
+            match = TAG.match(stripped)
+            if match:
+                game.headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        elif not stripped.startswith('%'):
+            body.append(line)
+
+    depth = 0
+    for match in MOVETEXT.finditer('\n'.join(body)):
+        result, token, parenthesis = match.groups()
+        if parenthesis:
+            depth += 1 if parenthesis == '(' else -1
+        elif depth:
+            continue
+        elif result:
+            game.result = result
+        elif token:
+            game.moves.append(token)
+    if game.result == '*' and game.headers.get('Result') in RESULTS:
+        game.result = game.headers['Result']
+    return game
+
+
+def read_games(source):
+    """Yield a PGNGame for every game of a PGN file or path, holding only one game in memory at a time"""
+    for text in split_games(source):
+        yield parse_game(text)
+
+
+def parse_san(board, san):
+    """Return the Move for a move in Standard Algebraic Notation in the position on board.
+
+    Raises ValueError when the move is not legal or is ambiguous."""
+    color = board.current_player
+    king_row = 7 if color == 'white' else 0
+    match = CASTLING.match(san)
+    if match:
+        move = Move((king_row, 4), (king_row, 2 if match.group(2) else 6))
+        if move in board.legal_moves(color, (king_row, 4)):
+            return move
+        raise ValueError(f"Illegal move: {san}")
+
+    match = SAN.match(san)
+    if not match:
+        raise ValueError(f"Invalid move: {san}")
+    symbol, from_file, from_rank, target, promotion = match.groups()
+    symbol = symbol or 'P'
+    end = convert_notation_to_index(target)
+    promotion = promotion.upper() if promotion else None
+    if symbol == 'P' and end[0] in (0, 7) and promotion is None:
+        raise ValueError(f"Missing promotion piece: {san}")
+
+    if symbol == 'P' and from_file is None:
+        # Pawn push, straight from the square behind the target or two squares behind
+        step = 1 if color == 'white' else -1
+        starts = [(end[0] + step, end[1])] if 0 <= end[0] + step < 8 else []
+        if end[0] == (4 if color == 'white' else 3) and board.board[end[0] + step][end[1]] is None:
+            starts.append((end[0] + 2 * step, end[1]))
+    else:
+        # The pieces of the player that attack the target square
+        opponent = 'black' if color == 'white' else 'white'
+        starts = [pos for pos in board.iter_attackers(end, opponent)]
+    starts = [(x, y) for x, y in starts
+              if board.board[x][y] is not None and board.board[x][y].symbol == symbol and
+              board.board[x][y].color == color and
+              (from_file is None or y == ord(from_file) - ord('a')) and
+              (from_rank is None or x == 8 - int(from_rank))]
+
+    moves = []
+    for start in starts:
+        move = Move(start, end, promotion)
+        if move in board.legal_moves(color, start):
+            moves.append(move)
+    if len(moves) == 1:
+        return moves[0]
+    raise ValueError(f"{'Ambiguous' if moves else 'Illegal'} move: {san}")
+
+
+def move_to_san(board, move):
+    """Return a legal move of the player to move in Standard Algebraic Notation"""
+    (start_x, start_y), (end_x, end_y) = move[0], move[1]
+    promotion = move[2] if len(move) > 2 else None
+    piece = board.board[start_x][start_y]
+    color = piece.color
+    target = convert_index_to_notation(end_x, end_y)
+
+    if piece.symbol == 'K' and abs(end_y - start_y) == 2:
+        san = 'O-O' if end_y > start_y else 'O-O-O'
+    elif piece.symbol == 'P':
+        san = target
+        if start_y != end_y:
+            san = convert_index_to_notation(start_x, start_y)[0] + 'x' + target
+        if promotion:
+            san += '=' + promotion
+    else:
+        # Name the file, the rank or both when another piece of the same kind can also go there
+        opponent = 'black' if color == 'white' else 'white'
+        others = [(x, y) for x, y in board.iter_attackers((end_x, end_y), opponent)
+                  if (x, y) != (start_x, start_y) and board.board[x][y].symbol == piece.symbol and
+                  Move((x, y), (end_x, end_y)) in board.legal_moves(color, (x, y))]
+        square = convert_index_to_notation(start_x, start_y)
+        if not others:
+            disambiguation = ''
+        elif all(y != start_y for _, y in others):
+            disambiguation = square[0]
+        elif all(x != start_x for x, _ in others):
+            disambiguation = square[1]
+        else:
+            disambiguation = square
+        capture = 'x' if board.board[end_x][end_y] is not None else ''
+        san = piece.symbol + disambiguation + capture + target
+
+    board.push(move)
+    if board.is_in_check(board.current_player):
+        san += '+' if any(True for _ in board.legal_moves()) else '#'
+    board.pop()
+    return san
+
+
+def escape_tag(value):
+    """Escape a tag value for writing between quotes, the reverse of what parse_game reads"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def write_game(headers, moves, result='*'):
+    """Return a game as PGN text from its tags and its moves in SAN"""
+    headers = dict(headers)
+    headers['Result'] = result
+    # The seven tag roster first, in its order, then the other tags
+    roster = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+    defaults = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?'}
+    lines = [f'[{name} "{escape_tag(headers.get(name, defaults.get(name)))}"]' for name in roster]
+    lines += [f'[{name} "{escape_tag(value)}"]' for name, value in headers.items() if name not in roster]
+    lines.append('')
+
+    # Black to move first in a set up position is written as "1..."
+    fen = headers.get('FEN', STARTING_FEN).split()
+    black_first = len(fen) > 1 and fen[1] == 'b'
+    number = int(fen[5]) if len(fen) > 5 else 1
+    tokens = []
+    for ply, san in enumerate(moves, 1 if black_first else 0):
+        if ply % 2 == 0:
+            tokens.append(f"{number + ply // 2}.")
+        elif not tokens:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def game_to_pgn(board, headers=None):
+    """Return the game played on board, the moves of its move_history, as PGN text.
+
+    The moves are replayed from the position the game started in; when the board was
+    restored from a save without its undo records, that is the standard starting position."""
+    headers = dict(headers or {})
+    start, moves = board.game_record()
+    replay = type(board).from_fen(start)
+    if start != STARTING_FEN:
+        headers.setdefault('SetUp', '1')
+        headers.setdefault('FEN', start)
+
+    sans = []
+    for move in moves:
+        sans.append(move_to_san(replay, move))
+        replay.push(move)
+
+    status = replay.game_status()
+    if status == 'checkmate':
+        result = '0-1' if replay.current_player == 'white' else '1-0'
+    elif status == 'stalemate':
+        result = '1/2-1/2'
+    else:
+        result = headers.get('Result', '*')
+    return write_game(headers, sans, result)
+
+
+def validate_games(texts, first_index=0, backend='list'):
+    """Replay the games of a chunk and return (games, moves, errors), one error dict per illegal move"""
+    board_class = BACKENDS[backend]
+    moves = 0
+    errors = []
+    for index, text in enumerate(texts, first_index):
+        game = parse_game(text)
+        try:
+            board = game.board(board_class)
+        except (ValueError, IndexError, KeyError) as error:
+            errors.append({'game': index, 'ply': 0, 'move': None, 'fen': game.headers.get('FEN'),
+                           'error': f"Invalid FEN: {error}"})
+            continue
+        for ply, san in enumerate(game.moves, 1):
+            try:
+                move = parse_san(board, san)
+            except ValueError as error:
+                errors.append({'game': index, 'ply': ply, 'move': san, 'fen': board.to_fen(),
+                               'white': game.headers.get('White'), 'black': game.headers.get('Black'),
+                               'error': str(error)})
+                break
+            board.push(move)
+            moves += 1
+    return len(texts), moves, errors
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.pgn',
+        description='Replay every game of a PGN file against the rules, in parallel, and print one JSON '
+                    'object per illegal move found followed by a summary with the games per second.')
+    parser.add_argument('file', help='PGN file to validate')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk', type=int, default=200, help='games sent to a worker at a time (default: 200)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='bitboard',
+                        help='board implementation to replay with (default: bitboard)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games = moves = errors = 0
+    workers = args.workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        # Keep a bounded number of chunks in flight so memory does not grow with the archive
+        limit = 2 * workers
+        pending = deque()
+        index = 0
+
+        def report(future):
+            nonlocal games, moves, errors
+            chunk_games, chunk_moves, chunk_errors = future.result()
+            games += chunk_games
+            moves += chunk_moves
+            errors += len(chunk_errors)
+            for error in chunk_errors:
+                print(json.dumps(error), flush=True)
+
+        for chunk in chunked(split_games(args.file), args.chunk):
+            pending.append(executor.submit(validate_games, chunk, index, args.backend))
+            index += len(chunk)
+            while len(pending) >= limit:
+                report(pending.popleft())
+        while pending:
+            report(pending.popleft())
+
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        'games': games,
+        'moves': moves,
+        'illegal': errors,
+        'seconds': round(seconds, 6),
+        'games_per_second': int(games / seconds) if seconds else None,
+    }))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
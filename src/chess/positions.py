@@ -0,0 +1,162 @@
+import argparse
+import json
+import re
+import struct
+import sys
+import time
+
+from .chess_game import ChessBoard
+from .bitboard import BitboardChessBoard
+from .zobrist import WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
+
+__all__ = ['read_fens', 'load_boards', 'pack_fen', 'unpack_fen', 'PositionArray', 'main']
+
+BACKENDS = {'list': ChessBoard, 'bitboard': BitboardChessBoard}
+
+# A packed position: one byte per square, row * 8 + col, then the side to move and
+# castling rights, the en passant file plus one (0 for none) and the two move counters
+RECORD = struct.Struct('<64sBBBH')
+
+PIECE_LETTERS = '.PNBRQKpnbrqk'
+SQUARE_CODES = bytes.maketrans(PIECE_LETTERS.encode(), bytes(range(len(PIECE_LETTERS))))
+SQUARE_LETTERS = bytes.maketrans(bytes(range(len(PIECE_LETTERS))), PIECE_LETTERS.encode())
+EMPTY_SQUARES = str.maketrans({str(count): '.' * count for count in range(1, 9)})
+CASTLING_BITS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+BLACK_TO_MOVE = 16
+
+
+def pack_fen(fen):
+    """Pack a FEN into a RECORD.size bytes record"""
+    fields = fen.split()
+    squares = fields[0].replace('/', '').translate(EMPTY_SQUARES).encode()
+    if len(squares) != 64:
+        raise ValueError(f"Invalid FEN placement: {fields[0]}")
+    flags = BLACK_TO_MOVE if fields[1] == 'b' else 0
+    castling = fields[2] if len(fields) > 2 else '-'
+    for letter in castling:
+        flags |= CASTLING_BITS.get(letter, 0)
+    en_passant = fields[3] if len(fields) > 3 else '-'
+    file = ord(en_passant[0]) - ord('a') + 1 if en_passant != '-' else 0
+    # EPD lines have operations instead of the counters
+    if len(fields) > 5 and fields[4].isdigit() and fields[5].isdigit():
+        halfmove_clock, fullmove_number = int(fields[4]), int(fields[5])
+    else:
+        halfmove_clock, fullmove_number = 0, 1
+    return RECORD.pack(squares.translate(SQUARE_CODES), flags, file,
+                       min(halfmove_clock, 255), min(fullmove_number, 65535))
+
+
+def unpack_fen(data, offset=0):
+    """Return the FEN of a record packed by pack_fen, read from data at offset"""
+    squares, flags, file, halfmove_clock, fullmove_number = RECORD.unpack_from(data, offset)
+    letters = squares.translate(SQUARE_LETTERS).decode()
+    placement = '/'.join(re.sub(r'\.+', lambda match: str(len(match.group())), letters[row:row + 8])
+                         for row in range(0, 64, 8))
+    castling = ''.join(letter for letter, bit in CASTLING_BITS.items() if flags & bit) or '-'
+    en_passant = '-'
+    if file:
+        en_passant = chr(ord('a') + file - 1) + ('3' if flags & BLACK_TO_MOVE else '6')
+    return (f"{placement} {'b' if flags & BLACK_TO_MOVE else 'w'} {castling} {en_passant} "
+            f"{halfmove_clock} {fullmove_number}")
+
+
+def read_fens(source):
+    """Yield the FEN (or EPD) lines of a file or path one at a time, skipping blank lines and # comments"""
+    if isinstance(source, str):
+        with open(source, encoding='utf-8') as file:
+            yield from read_fens(file)
+        return
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def load_boards(source, board_class=ChessBoard):
+    """Yield a board for every position of a FEN file, reading it as they are consumed"""
+    from_fen = board_class.from_fen
+    for fen in read_fens(source):
+        yield from_fen(fen)
+
+
+class PositionArray:
+    """Many positions packed into one bytearray, RECORD.size bytes each.
+
+    Positions are packed straight from their FEN without building a board, and
+    turned back into a FEN or a board only when one is asked for.
+    """
+
+    def __init__(self, fens=()):
+        self.data = bytearray()
+        self.extend(fens)
+
+    @classmethod
+    def load(cls, source):
+        """Pack every position of a FEN file"""
+        return cls(read_fens(source))
+
+    def __len__(self):
+        return len(self.data) // RECORD.size
+
+    def append(self, fen):
+        self.data += pack_fen(fen)
+
+    def extend(self, fens):
+        for fen in fens:
+            self.append(fen)
+
+    def fen(self, index):
+        """Return the FEN of the position at index"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('position index out of range')
+        return unpack_fen(self.data, index * RECORD.size)
+
+    def board(self, index, board_class=ChessBoard):
+        """Return a board set up with the position at index"""
+        return board_class.from_fen(self.fen(index))
+
+    def __getitem__(self, index):
+        return self.fen(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.fen(index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.positions',
+        description='Load a file of FEN positions and print the parse throughput as a JSON object.')
+    parser.add_argument('file', help='file with one FEN or EPD position per line')
+    parser.add_argument('--array', action='store_true',
+                        help='pack the positions into a PositionArray instead of building boards')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='list',
+                        help='board implementation to build (default: list)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.array:
+        positions = PositionArray.load(args.file)
+        count = len(positions)
+        size = len(positions.data)
+    else:
+        count = 0
+        for _ in load_boards(args.file, BACKENDS[args.backend]):
+            count += 1
+        size = None
+    seconds = time.perf_counter() - start
+    result = {
+        'positions': count,
+        'seconds': round(seconds, 6),
+        'positions_per_second': int(count / seconds) if seconds else None,
+    }
+    if size is not None:
+        result['bytes'] = size
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import os
+import struct
+
+from .chess_game import ChessBoard, encode_move, decode_move
+from .positions import RECORD, pack_fen, unpack_fen
+
+__all__ = ['save_binary', 'load_binary', 'is_binary', 'GameJournal']
+
+# A binary save is a header with the starting position followed by a stream of
+# 16-bit big-endian words: moves as packed by encode_move, which never set the top
+# bit, and two markers. A checkpoint is followed by the packed position at that
+# point, an undo takes back the move before it. A journal is
+# the same file with words appended as the game goes on.
+MAGIC = b'CHSB'
+VERSION = 1
+HEADER = struct.Struct('>4sB')
+WORD = struct.Struct('>H')
+CHECKPOINT = 0xFFFF
+UNDO = 0xFFFE
+CHECKPOINT_SIZE = WORD.size + RECORD.size
+START = HEADER.size + RECORD.size
+
+
+def is_binary(filename):
+    """Whether a save file is in the binary format"""
+    with open(filename, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def header_bytes(fen):
+    return HEADER.pack(MAGIC, VERSION) + pack_fen(fen)
+
+
+def save_binary(board, filename):
+    """Save the game played on board: its starting position, its moves and a checkpoint at the end"""
+    start, moves = board.game_record()
+    data = bytearray(header_bytes(start))
+    for move in moves:
+        data += WORD.pack(encode_move(move))
+    data += WORD.pack(CHECKPOINT) + pack_fen(board.to_fen())
+    with open(filename, 'wb') as file:
+        file.write(data)
+
+
+def read_records(data):
+    """Return the starting FEN, the moves still on the board after undos, the last usable
+    checkpoint as (number of moves played at that point, FEN) or None, and the offset
+    where the complete records end.
+
+    A record cut short at the end of the data, as left by a crash, is ignored."""
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a binary save file")
+    start = unpack_fen(data, HEADER.size)
+    moves = []
+    checkpoint = None
+    offset = START
+    while offset + WORD.size <= len(data):
+        (word,) = WORD.unpack_from(data, offset)
+        if word == CHECKPOINT:
+            if offset + CHECKPOINT_SIZE > len(data):
+                break
+            checkpoint = (len(moves), unpack_fen(data, offset + WORD.size))
+            offset += CHECKPOINT_SIZE
+            continue
+        if word == UNDO:
+            if moves:
+                moves.pop()
+            # A checkpoint past the moves left is no longer on the game's path
+            if checkpoint is not None and checkpoint[0] > len(moves):
+                checkpoint = None
+        else:
+            moves.append(decode_move(word))
+        offset += WORD.size
+    return start, moves, checkpoint, offset
+
+
+def load_binary(filename, board_class=ChessBoard, replay=True):
+    """Load a binary save or journal.
+
+    With replay, every move is played again from the starting position so the whole game
+    can be taken back; otherwise the board starts from the last checkpoint and only the
+    moves after it are played, which is faster but keeps only them in its history."""
+    with open(filename, 'rb') as file:
+        data = file.read()
+    start, moves, checkpoint, _ = read_records(data)
+    if not replay and checkpoint is not None:
+        played, start = checkpoint
+        moves = moves[played:]
+    board = board_class.from_fen(start)
+    for move in moves:
+        piece = board.board[move.start[0]][move.start[1]]
+        if piece is None or piece.color != board.current_player:
+            raise ValueError(f"Invalid move in save file: {move}")
+        board.make_move(move.start, move.end, check_rules=False, promotion=move.promotion)
+        board.switch_player()
+        board.record_move(piece, move.start, move.end)
+    return board
+
+
+class GameJournal:
+    """Append-only record of a game, written a move at a time as it is played.
+
+    Attach it to a board with attach() and every move_piece and undo_move is added
+    to the file and flushed, so saving costs the same for every move and the game
+    survives a crash. A checkpoint with the whole position is written every
+    checkpoint_interval moves so the game can be loaded without replaying it all.
+    """
+
+    def __init__(self, filename, checkpoint_interval=64):
+        self.filename = filename
+        self.checkpoint_interval = checkpoint_interval
+        self.file = None
+        self.board = None
+        self.since_checkpoint = 0
+
+    def attach(self, board):
+        """Start a new journal for the game on board, replacing the file"""
+        self.close()
+        start, moves = board.game_record()
+        self.file = open(self.filename, 'wb')
+        self.file.write(header_bytes(start))
+        for move in moves:
+            self.file.write(WORD.pack(encode_move(move)))
+        self.file.flush()
+        self.since_checkpoint = len(moves)
+        self.board = board
+        board.journal = self
+
+    def resume(self, board_class=ChessBoard):
+        """Load the game from an existing journal, attach to it and keep appending to the file"""
+        self.close()
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+        _, _, _, end = read_records(data)
+        board = load_binary(self.filename, board_class)
+        self.file = open(self.filename, 'r+b')
+        # Drop whatever a crash left half written
+        self.file.truncate(end)
+        self.file.seek(end)
+        self.since_checkpoint = 0
+        self.board = board
+        board.journal = self
+        return board
+
+    def append(self, move):
+        self.write(WORD.pack(encode_move(move)))
+        self.since_checkpoint += 1
+        if self.since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def undo(self):
+        self.write(WORD.pack(UNDO))
+        self.since_checkpoint += 1
+
+    def checkpoint(self):
+        """Write the current position so loading can start from it"""
+        self.write(WORD.pack(CHECKPOINT) + pack_fen(self.board.to_fen()))
+        self.since_checkpoint = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+
+    def sync(self):
+        """Make sure the journal is on disk, not only handed to the operating system"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.board is not None and self.board.journal is self:
+            self.board.journal = None
+        self.board = None
@@ -0,0 +1,260 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sys
+import time
+
+from .chess_game import ChessBoard, STARTING_FEN, convert_move_to_notation
+from .positions import read_fens
+
+__all__ = ['make_player', 'play_game', 'adjudicate', 'elo_difference', 'main']
+
+# Players are given as 'random', 'depth:N' or 'nodes:N'
+PLAYER_KINDS = ('random', 'depth', 'nodes')
+
+# Points for white of each result
+SCORES = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}
+
+# Pieces that cannot mate on their own, with the king alone on the other side
+MINOR_PIECES = ('N', 'B')
+
+# Engines of the worker process by player and color, kept so they are made once per process
+# and each side of a game searches with a table of its own, even when both are the same player
+ENGINES = {}
+
+
+def check_player(spec):
+    """argparse type for a player: return the spec when it is valid"""
+    kind, _, value = spec.partition(':')
+    if kind not in PLAYER_KINDS or (kind == 'random') != (value == '') or (value and not value.isdigit()):
+        raise argparse.ArgumentTypeError(f"invalid player {spec!r}, use random, depth:N or nodes:N")
+    return spec
+
+
+def make_player(spec, color, seed=None):
+    """Return a function from a board to the move the player with color picks in it"""
+    kind, _, value = spec.partition(':')
+    if kind == 'random':
+        rng = random.Random(seed)
+        return lambda board: rng.choice(board.cached_legal_moves())
+    engine = ENGINES.get((spec, color))
+    if engine is None:
+        from .engine import Engine
+        engine = Engine(max_depth=int(value)) if kind == 'depth' else Engine(max_nodes=int(value))
+        ENGINES[(spec, color)] = engine
+    # Start every game from a clean table so its result does not depend on the games before
+    engine.new_game()
+    engine.ordering.random = random.Random(seed) if seed is not None else None
+    return lambda board: engine.search(board).move
+
+
+def insufficient_material(board):
+    """Whether neither side has the pieces left to mate: kings alone or with one knight or bishop"""
+    pieces = [piece.symbol for row in board.board for piece in row if piece is not None and piece.symbol != 'K']
+    return not pieces or (len(pieces) == 1 and pieces[0] in MINOR_PIECES)
+
+
+def repetitions(board):
+    """How many times the position occurred since the last capture or pawn move, this time included"""
+    key = board.zobrist_key
+    count = 1
+    for record in reversed(board.undo_stack):
+        if record[10] == key:
+            count += 1
+        if record[2].symbol == 'P' or record[4] is not None:
+            break
+    return count
+
+
+def adjudicate(board, status, halfmove_clock):
+    """Return (result, reason) when the game on board is over after a move, or None.
+
+    status is what move_piece returned for the move."""
+    if status == 'checkmate':
+        return ('0-1' if board.current_player == 'white' else '1-0'), 'checkmate'
+    if status == 'stalemate':
+        return '1/2-1/2', 'stalemate'
+    if insufficient_material(board):
+        return '1/2-1/2', 'insufficient material'
+    if halfmove_clock >= 100:
+        return '1/2-1/2', 'fifty moves'
+    if repetitions(board) >= 3:
+        return '1/2-1/2', 'repetition'
+    return None
+
+
+def play_game(fen, white, black, seed=None, max_plies=400):
+    """Play a game from fen between two players and return its record as a dict.
+
+    Every move is played with move_piece, whose status ends the game on checkmate or
+    stalemate; a game still going after max_plies is adjudicated a draw. An illegal
+    move loses the game for the player that made it."""
+    board = ChessBoard.from_fen(fen)
+    players = {'white': make_player(white, 'white', seed),
+               'black': make_player(black, 'black', None if seed is None else seed + 1)}
+    thinking = {'white': 0.0, 'black': 0.0}
+    counts = {'white': 0, 'black': 0}
+    halfmove_clock = board.fen_counters[0]
+    moves = []
+    start = time.perf_counter()
+    outcome = None
+    while outcome is None and len(moves) < max_plies:
+        color = board.current_player
+        clock = time.perf_counter()
+        move = players[color](board)
+        thinking[color] += time.perf_counter() - clock
+        counts[color] += 1
+        piece = board.board[move.start[0]][move.start[1]] if move else None
+        status = board.move_piece(move.start, move.end, move.promotion) if move else False
+        if status is False:
+            outcome = ('0-1' if color == 'white' else '1-0'), 'illegal move'
+            break
+        moves.append(convert_move_to_notation(move))
+        halfmove_clock = 0 if piece.symbol == 'P' or board.undo_stack[-1][4] is not None else halfmove_clock + 1
+        outcome = adjudicate(board, status, halfmove_clock)
+    result, reason = outcome or ('1/2-1/2', 'move limit')
+    return {
+        'fen': fen,
+        'white': white,
+        'black': black,
+        'result': result,
+        'reason': reason,
+        'plies': len(moves),
+        'seconds': round(time.perf_counter() - start, 6),
+        'white_moves': counts['white'],
+        'black_moves': counts['black'],
+        'white_seconds': round(thinking['white'], 6),
+        'black_seconds': round(thinking['black'], 6),
+        'moves': ' '.join(moves),
+    }
+
+
+def elo(score):
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_difference(wins, draws, losses):
+    """Return the Elo difference from a score, and the half width of its 95% confidence interval.
+
+    Either is None when the score is all wins or all losses, where the difference has no bound."""
+    games = wins + draws + losses
+    if not games:
+        return None, None
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    if not 0 < score < 1:
+        return None, None
+    difference = elo(score)
+    if not 0 < score - margin or not score + margin < 1:
+        return difference, None
+    return difference, (elo(score + margin) - elo(score - margin)) / 2
+
+
+def move_ms(seconds, moves):
+    """Average milliseconds per move"""
+    return round(1000 * seconds / moves, 3) if moves else None
+
+
+def schedule(openings, games):
+    """Yield (game, opening index, whether player 1 has white) for each game: every opening
+    is played twice, once with each color, before the openings start over"""
+    for game in range(games):
+        pair = game // 2
+        yield game, pair % len(openings), game % 2 == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.selfplay',
+        description='Play games between two players in worker processes, write one JSON object per game '
+                    'as it finishes and a summary with the games per second, move latency and Elo difference.')
+    parser.add_argument('player1', type=check_player, help="random, depth:N or nodes:N")
+    parser.add_argument('player2', type=check_player, help="random, depth:N or nodes:N")
+    parser.add_argument('--games', type=int, default=100, help='games to play (default: 100)')
+    parser.add_argument('--openings', help='FEN or EPD file of the positions games start from '
+                                           '(default: the starting position)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--max-plies', type=int, default=400,
+                        help='moves after which a game is adjudicated a draw (default: 400)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the random players and engines, to play the same games again '
+                             '(default: a new one every run, printed in the summary)')
+    parser.add_argument('--output', help='append the game results to this file instead of printing them')
+    args = parser.parse_args(argv)
+
+    # Every game gets a seed of its own, so engines break ties differently and games
+    # from the same opening and colors are not all the same game
+    if args.seed is None:
+        args.seed = random.SystemRandom().randrange(1 << 32)
+    openings = list(read_fens(args.openings)) if args.openings else [STARTING_FEN]
+    if not openings:
+        parser.error(f"no positions in {args.openings}")
+    output = open(args.output, 'a') if args.output else sys.stdout
+    workers = args.workers or os.cpu_count() or 1
+    wins = draws = losses = plies = 0
+    # Seconds and moves of player 1 and player 2, apart even when they are the same player
+    thinking = {1: [0.0, 0], 2: [0.0, 0]}
+    start = time.perf_counter()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            # Keep a bounded number of games in flight and write each as soon as it finishes
+            limit = 2 * workers
+            games = schedule(openings, args.games)
+            pending = {}
+            while True:
+                for game, opening, first_white in games:
+                    white, black = (args.player1, args.player2) if first_white else (args.player2, args.player1)
+                    seed = args.seed + 2 * game
+                    future = executor.submit(play_game, openings[opening], white, black, seed, args.max_plies)
+                    pending[future] = (game, opening, first_white)
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    break
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    game, opening, first_white = pending.pop(future)
+                    record = future.result()
+                    score = SCORES[record['result']] if first_white else 1 - SCORES[record['result']]
+                    wins += score == 1
+                    draws += score == 0.5
+                    losses += score == 0
+                    plies += record['plies']
+                    for color in ('white', 'black'):
+                        totals = thinking[1 if (color == 'white') == first_white else 2]
+                        totals[0] += record[f'{color}_seconds']
+                        totals[1] += record[f'{color}_moves']
+                    print(json.dumps(dict(record, game=game, opening=opening)), file=output, flush=True)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    seconds = time.perf_counter() - start
+    games = wins + draws + losses
+    difference, margin = elo_difference(wins, draws, losses)
+    print(json.dumps({
+        'player1': args.player1,
+        'player2': args.player2,
+        'seed': args.seed,
+        'games': games,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'score': round((wins + draws / 2) / games, 4) if games else None,
+        'elo': round(difference, 1) if difference is not None else None,
+        'elo_error': round(margin, 1) if margin is not None else None,
+        'plies': plies,
+        'seconds': round(seconds, 6),
+        'games_per_second': round(games / seconds, 3) if seconds else None,
+        'player1_move_ms': move_ms(*thinking[1]),
+        'player2_move_ms': move_ms(*thinking[2]),
+    }), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import os
+import pathlib
+import signal
+import sys
+import traceback
+
+from .chess_game import ChessBoard, save_game, load_game, convert_move_to_notation, convert_notation_to_move
+
+__all__ = ['GameServer', 'GameSession', 'position_status', 'validate_move', 'engine_move', 'main']
+
+OPS = ('new', 'join', 'move', 'state', 'save')
+
+# Types the fields of a request may have
+FIELD_TYPES = {
+    'op': (str,),
+    'game': (str, int),
+    'move': (str,),
+    'engine': (str, type(None)),
+    'movetime': (int, float, type(None)),
+}
+
+# A game that has ended takes no more moves
+FINISHED = ('checkmate', 'stalemate')
+
+# The engine of each worker process, kept between searches so its table carries over
+ENGINE = None
+
+
+def check_request(request):
+    """Raise ValueError when a request is not an object or one of its fields has the wrong type"""
+    if not isinstance(request, dict):
+        raise ValueError("A request must be a JSON object")
+    for field, types in FIELD_TYPES.items():
+        # JSON true and false are ints to isinstance
+        if field in request and (not isinstance(request[field], types) or isinstance(request[field], bool)):
+            raise ValueError(f"Invalid {field}: {request[field]!r}")
+
+
+def check_engine(engine_color, movetime):
+    """Raise ValueError unless the engine color and its time per move can start a game"""
+    if engine_color not in (None, 'white', 'black'):
+        raise ValueError(f"Invalid engine color: {engine_color}")
+    if movetime is not None and not 0 < movetime < float('inf'):
+        raise ValueError(f"Invalid movetime: {movetime}")
+
+
+def position_summary(board, status):
+    """The status and legal moves of the player to move, for the reply to a client"""
+    return status, [convert_move_to_notation(move) for move in board.cached_legal_moves()]
+
+
+def position_status(fen):
+    """Run in a worker process: return the status and legal moves of a position"""
+    board = ChessBoard.from_fen(fen)
+    return position_summary(board, board.game_status())
+
+
+def validate_move(fen, notation):
+    """Run in a worker process: check a move in coordinate notation against the position.
+
+    Returns (move, status, legal moves) after the move, or (None, error, None) when it is illegal.
+    A pawn reaching the last rank without a promotion piece becomes a queen."""
+    board = ChessBoard.from_fen(fen)
+    try:
+        move = convert_notation_to_move(notation)
+    except ValueError as error:
+        return None, str(error), None
+    if move.promotion is None:
+        piece = board.board[move.start[0]][move.start[1]]
+        if piece is not None and piece.symbol == 'P' and move.end[0] in (0, 7):
+            move = move._replace(promotion='Q')
+    if move not in board.cached_legal_moves():
+        return None, f"Illegal move: {notation}", None
+    board.push(move)
+    return (move,) + position_summary(board, board.game_status())
+
+
+def engine_move(board, movetime):
+    """Run in a worker process: search the game on board for up to movetime seconds.
+
+    Returns (move, status, legal moves) after the move found."""
+    global ENGINE
+    if ENGINE is None:
+        from .engine import Engine
+        ENGINE = Engine()
+    move = ENGINE.search(board, max_time=movetime).move
+    board.push(move)
+    return (move,) + position_summary(board, board.game_status())
+
+
+class GameSession:
+    """A game played on the server: its board, who the engine plays if anyone, and the
+    connections following it.
+
+    Requests for the same game are handled one at a time under lock."""
+
+    def __init__(self, game_id, board, engine_color=None, movetime=1.0):
+        self.id = game_id
+        self.board = board
+        self.engine_color = engine_color
+        self.movetime = movetime
+        self.lock = asyncio.Lock()
+        self.subscribers = set()
+        self.status = 'playing'
+        self.legal = None
+
+    def apply(self, move, status, legal):
+        """Play a move already checked by a worker, without generating moves again"""
+        board = self.board
+        piece = board.board[move.start[0]][move.start[1]]
+        board.make_move(move.start, move.end, check_rules=False, promotion=move.promotion)
+        board.switch_player()
+        board.record_move(piece, move.start, move.end)
+        board.status_cache = (board.zobrist_key, status)
+        self.status = status
+        self.legal = legal
+
+    def state(self):
+        return {
+            'game': self.id,
+            'fen': self.board.to_fen(),
+            'turn': self.board.current_player,
+            'status': self.status,
+            'engine': self.engine_color,
+            'moves': len(self.board.move_history),
+            'legal': self.legal,
+        }
+
+
+class GameServer:
+    """Serve many games over TCP, one JSON request per line and one JSON reply per request.
+
+    Requests are objects with an "op" and its arguments:
+      {"op": "new", "engine": "black", "movetime": 0.5}  start a game, optionally against the engine
+      {"op": "join", "game": id}                          follow a game, loading it from save_dir if needed
+      {"op": "move", "game": id, "move": "e2e4"}          play a move, and the engine's reply if it plays
+      {"op": "state", "game": id}                         the position, status and legal moves
+      {"op": "save", "game": id}                          write the game to save_dir now
+    Replies carry "ok" or an "error"; the connections following a game are sent
+    {"event": "move", ...} when someone else moves in it.
+
+    Checking moves and searching run in worker processes and saving in a thread, so the
+    event loop only ever plays moves already known to be legal. Searches have a pool of
+    their own, search_workers processes, so that a move is never checked behind one.
+    """
+
+    def __init__(self, workers=None, save_dir=None, save_format='json', movetime=1.0, search_workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.search_workers = search_workers or self.workers
+        self.save_dir = pathlib.Path(save_dir) if save_dir else None
+        self.extension = '.chess' if save_format == 'chess' else '.json'
+        self.movetime = movetime
+        self.sessions = {}
+        self.counter = itertools.count(1)
+        self.executor = None
+        self.search_executor = None
+        self.server = None
+        self.connections = {}
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start the worker processes and listen, returning the port listened on"""
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.search_executor = concurrent.futures.ProcessPoolExecutor(self.search_workers)
+        # Start the workers now rather than on the first move
+        await asyncio.gather(*(self.run(position_status, ChessBoard().to_fen()) for _ in range(self.workers)))
+        if self.save_dir is not None:
+            self.save_dir.mkdir(parents=True, exist_ok=True)
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Close the connections still open and let their handlers finish
+            handlers = list(self.connections.values())
+            for writer in list(self.connections):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self.server.wait_closed()
+        for executor in (self.executor, self.search_executor):
+            if executor is not None:
+                executor.shutdown()
+
+    def run(self, function, *args, executor=None):
+        return asyncio.get_running_loop().run_in_executor(executor or self.executor, function, *args)
+
+    def path(self, game_id):
+        return self.save_dir / f"{game_id}{self.extension}"
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection until it closes"""
+        following = set()
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request = None
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    reply = await self.dispatch(request, writer, following)
+                except KeyError as error:
+                    reply = {'error': f"Missing field: {error.args[0]}"}
+                except (ValueError, TypeError) as error:
+                    reply = {'error': str(error)}
+                except Exception as error:
+                    # A bug or a broken worker pool: answer rather than drop the connection
+                    traceback.print_exc()
+                    reply = {'error': f"Internal error: {error}"}
+                if isinstance(request, dict) and 'id' in request:
+                    reply['id'] = request['id']
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for session in following:
+                session.subscribers.discard(writer)
+            self.connections.pop(writer, None)
+            writer.close()
+
+    async def dispatch(self, request, writer, following):
+        check_request(request)
+        op = request['op']
+        if op not in OPS:
+            return {'error': f"Unknown op: {op}"}
+        if op == 'new':
+            session = await self.new_game(request.get('engine'), request.get('movetime'))
+        else:
+            session = await self.session(str(request['game']), request.get('engine'), request.get('movetime'))
+        if op in ('new', 'join'):
+            session.subscribers.add(writer)
+            following.add(session)
+            return dict(session.state(), ok=True)
+        if op == 'state':
+            return dict(session.state(), ok=True)
+        if op == 'move':
+            return await self.move(session, request['move'], writer)
+        if self.save_dir is None:
+            return {'error': "The server was started without a save directory"}
+        async with session.lock:
+            await self.save(session)
+        return {'ok': True, 'game': session.id}
+
+    async def new_game(self, engine_color=None, movetime=None):
+        check_engine(engine_color, movetime)
+        game_id = f"{next(self.counter)}-{os.urandom(4).hex()}"
+        session = GameSession(game_id, ChessBoard(), engine_color, movetime or self.movetime)
+        async with session.lock:
+            session.status, session.legal = position_summary(session.board, 'playing')
+            if engine_color == 'white':
+                await self.engine_reply(session)
+            await self.save(session)
+        # Only a game that started is kept, its id has not been given to anyone before
+        self.sessions[game_id] = session
+        return session
+
+    async def session(self, game_id, engine_color=None, movetime=None):
+        """Return the game with that id, loading it from save_dir when it is not in memory"""
+        session = self.sessions.get(game_id)
+        if session is not None:
+            return session
+        check_engine(engine_color, movetime)
+        # Ids are made by new_game, anything else could name a file outside save_dir
+        if self.save_dir is None or not game_id.replace('-', '').isalnum() or not self.path(game_id).exists():
+            raise ValueError(f"No game {game_id}")
+        loop = asyncio.get_running_loop()
+        board = await loop.run_in_executor(None, load_game, str(self.path(game_id)))
+        # Another request may have loaded it meanwhile
+        session = self.sessions.setdefault(game_id, GameSession(game_id, board, engine_color,
+                                                                  movetime or self.movetime))
+        if session.board is board:
+            async with session.lock:
+                session.status, session.legal = await self.run(position_status, board.to_fen())
+                if engine_color == board.current_player and session.status not in FINISHED:
+                    await self.engine_reply(session)
+                    await self.save(session)
+        return session
+
+    async def move(self, session, notation, writer):
+        async with session.lock:
+            if session.status in FINISHED:
+                return {'error': f"The game is over ({session.status})", 'game': session.id}
+            if session.engine_color == session.board.current_player:
+                return {'error': "It is the engine's turn", 'game': session.id}
+            move, status, legal = await self.run(validate_move, session.board.to_fen(), notation)
+            if move is None:
+                return {'error': status, 'game': session.id}
+            session.apply(move, status, legal)
+            self.notify(session, move, writer)
+            reply = {'ok': True, 'move': convert_move_to_notation(move)}
+            if session.engine_color is not None and status not in FINISHED:
+                reply['reply'] = convert_move_to_notation(await self.engine_reply(session))
+            await self.save(session)
+            return dict(session.state(), **reply)
+
+    async def engine_reply(self, session):
+        move, status, legal = await self.run(engine_move, session.board, session.movetime,
+                                             executor=self.search_executor)
+        session.apply(move, status, legal)
+        self.notify(session, move)
+        return move
+
+    def notify(self, session, move, source=None):
+        """Tell the other connections following the game about a move"""
+        event = json.dumps({'event': 'move', 'game': session.id, 'move': convert_move_to_notation(move),
+                            'fen': session.board.to_fen(), 'status': session.status}).encode() + b'\n'
+        for writer in session.subscribers:
+            if writer is not source and not writer.is_closing():
+                writer.write(event)
+
+    async def save(self, session):
+        """Write the game with save_game in a thread, the caller holding its lock.
+
+        The thread is given a copy taken on the loop, so requests answered meanwhile
+        never see the board while it is being written."""
+        if self.save_dir is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, save_game, session.board.copy(), str(self.path(session.id)))
+
+
+async def serve(args):
+    server = GameServer(args.workers, args.save_dir, args.format, args.movetime, args.search_workers)
+    port = await server.start(args.host, args.port)
+    print(json.dumps({'host': args.host, 'port': port, 'workers': server.workers,
+                      'search_workers': server.search_workers}), flush=True)
+    # Stop on SIGTERM as on Ctrl-C, so close() shuts the worker processes down
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stopping.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Not on Windows, where Ctrl-C still raises KeyboardInterrupt
+    try:
+        await stopping.wait()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.server',
+        description='Serve many games at once over TCP, one JSON request and reply per line, checking '
+                    'moves and searching in worker processes. Prints the port listened on as JSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on, 0 for any (default: 8765)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--search-workers', type=int, default=None,
+                        help='worker processes for engine searches (default: as many as --workers)')
+    parser.add_argument('--save-dir', default=None, help='directory every game is saved to after each move')
+    parser.add_argument('--format', choices=['json', 'chess'], default='json',
+                        help='save format, JSON or the compact binary one (default: json)')
+    parser.add_argument('--movetime', type=float, default=1.0,
+                        help='seconds the engine thinks per move unless a game asks otherwise (default: 1)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,303 @@
+import argparse
+import json
+import multiprocessing
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+
+from .chess_game import ChessBoard, encode_move, decode_move, convert_move_to_notation
+from .engine import Engine, TranspositionTable, book_result
+
+__all__ = ['SharedTranspositionTable', 'ParallelEngine', 'BENCHMARK_POSITIONS', 'main']
+
+# Middlegame and endgame positions used to measure the speedup of the parallel search
+BENCHMARK_POSITIONS = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'),
+    ('italian', 'r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQK2R w KQkq - 0 5'),
+    ('queens-gambit', 'rnbqkb1r/ppp2ppp/4pn2/3p2B1/2PP4/2N5/PP2PPPP/R2QKBNR b KQkq - 3 4'),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1'),
+    ('rook-endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'),
+]
+
+SCORE_OFFSET = 1 << 31
+
+# Seconds between checks that the workers are still alive while waiting for their results
+POLL_INTERVAL = 0.1
+
+# Seconds the helpers are given to report once stopped
+STOP_TIMEOUT = 5
+
+
+class SharedTranspositionTable:
+    """Transposition table in shared memory that worker processes read and write without locks.
+
+    Each entry is two 64-bit words: the key XORed with the data, and the data itself
+    (16-bit move, depth, flag and score). A write torn by another process leaves a pair
+    that no longer XORs back to the key, so it reads as a miss instead of a wrong entry.
+    """
+
+    def __init__(self, bits=20, name=None):
+        self.size = 1 << bits
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.size * 16)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.words = self.memory.buf.cast('Q')
+        if name is None:
+            self.clear()
+
+    def clear(self):
+        self.memory.buf[:] = bytes(self.size * 16)
+
+    def probe(self, key):
+        """Return (depth, score, flag, move) stored for the key, or None"""
+        index = (key & (self.size - 1)) * 2
+        data = self.words[index + 1]
+        if self.words[index] ^ data != key or not data:
+            return None
+        code = data & 0xFFFF
+        return (data >> 16 & 0xFF, (data >> 32) - SCORE_OFFSET, data >> 24 & 0xFF,
+                decode_move(code) if code else None)
+
+    def store(self, key, depth, score, flag, move):
+        data = (encode_move(move) if move else 0) | (max(depth, 0) & 0xFF) << 16 | flag << 24 | \
+               (score + SCORE_OFFSET) << 32
+        index = (key & (self.size - 1)) * 2
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+
+    def close(self, unlink=False):
+        """Detach from the shared memory, and free it when unlink is true.
+
+        The view of the words is released first, the memory cannot be closed while it exists."""
+        if self.words is None:
+            return
+        self.words.release()
+        self.words = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def search_worker(table_name, table_bits, worker_id, tasks, stop_event, results):
+    """Serve searches in a worker process until None arrives on its tasks queue.
+
+    A task is (search_id, board, limits) and is answered with (search_id, worker_id, result)
+    on the results queue; 'new_game' clears the move ordering learned so far."""
+    table = SharedTranspositionTable(table_bits, name=table_name)
+    try:
+        # Helpers shuffle their quiet moves and half of them start one ply deeper,
+        # so they fill the shared table with positions the main search reaches later
+        engine = Engine(table=table, seed=worker_id if worker_id else None)
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            if task == 'new_game':
+                engine.ordering.clear()
+                continue
+            search_id, board, limits = task
+            result = engine.search(board, *limits, start_depth=1 + worker_id % 2, stop_event=stop_event)
+            results.put((search_id, worker_id, result))
+    finally:
+        table.close()
+
+
+class ParallelEngine:
+    """Lazy SMP search: several processes search the same position and share one transposition table.
+
+    The search ends when the main worker finishes; the helpers are then stopped and the
+    result of the deepest completed search is returned, with the nodes of every worker.
+    If the main worker dies, the search ends with what the helpers found.
+
+    The worker processes are started once and serve every search, each given the position
+    over a queue of its own; a worker that died or hung is replaced at the next search.
+    They and the shared table must be freed with close(), or by using the engine in a
+    with statement.
+    """
+
+    def __init__(self, workers=None, max_depth=None, max_nodes=None, max_time=None, table_bits=20,
+                 book=None, book_best=False):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.book = book
+        self.book_best = book_best
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.table = SharedTranspositionTable(table_bits)
+        self.table_bits = table_bits
+        self.stop_event = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.processes = [None] * self.workers
+        self.tasks = [None] * self.workers
+        self.search_id = 0
+
+    def start(self):
+        """Start the worker processes that are not running"""
+        for worker_id, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                continue
+            self.tasks[worker_id] = multiprocessing.Queue()
+            self.processes[worker_id] = multiprocessing.Process(
+                target=search_worker, daemon=True,
+                args=(self.table.name, self.table_bits, worker_id, self.tasks[worker_id],
+                      self.stop_event, self.results))
+            self.processes[worker_id].start()
+
+    def new_game(self):
+        """Forget everything learned from previous searches"""
+        self.table.clear()
+        for worker_id, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                self.tasks[worker_id].put('new_game')
+
+    def stop(self):
+        """Ask a running search to return its best move as soon as possible, or the next one
+        if it is about to start"""
+        self.stop_event.set()
+
+    def close(self):
+        """Stop the worker processes and free the shared transposition table"""
+        for worker_id, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                self.tasks[worker_id].put(None)
+        for process in self.processes:
+            if process is not None:
+                process.join(STOP_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        self.processes = [None] * self.workers
+        self.table.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def collect(self, finished, wanted, deadline=None):
+        """Put the results of the current search in finished until the wanted workers have
+        all answered, the ones left have died or the deadline has passed"""
+        while not wanted <= finished.keys() and (deadline is None or time.perf_counter() < deadline):
+            # A worker found dead before waiting has nothing left to send
+            alive = any(self.processes[worker_id].is_alive() for worker_id in wanted - finished.keys())
+            try:
+                search_id, worker_id, result = self.results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not alive:
+                    return
+                continue
+            # Results of an earlier search that gave up on a hung worker are dropped
+            if search_id == self.search_id:
+                finished[worker_id] = result
+
+    def search(self, board, max_depth=None, max_nodes=None, max_time=None):
+        """Search the position for the player to move and return a SearchResult"""
+        result = book_result(self.book, board, self.book_best)
+        if result is not None:
+            return result
+        limits = (max_depth or self.max_depth, max_nodes or self.max_nodes, max_time or self.max_time)
+        self.start()
+        self.search_id += 1
+        start = time.perf_counter()
+        for tasks in self.tasks:
+            tasks.put((self.search_id, board, limits))
+
+        finished = {}
+        try:
+            self.collect(finished, {0})
+        finally:
+            self.stop_event.set()
+            self.collect(finished, set(range(self.workers)), time.perf_counter() + STOP_TIMEOUT)
+            # Workers that did not answer in time are replaced, the others stay for the next search
+            for worker_id, process in enumerate(self.processes):
+                if worker_id not in finished and process.is_alive():
+                    process.terminate()
+                    process.join()
+            # Cleared once the search is over, so a stop made just before it started was not lost
+            self.stop_event.clear()
+
+        if not finished:
+            raise RuntimeError("Every search worker ended without a result")
+        seconds = time.perf_counter() - start
+        nodes = sum(result.nodes for result in finished.values())
+        best = max(finished.values(), key=lambda result: result.depth)
+        if 0 in finished and best.depth == finished[0].depth:
+            best = finished[0]
+        return best._replace(nodes=nodes, seconds=seconds, nps=int(nodes / seconds) if seconds else 0)
+
+
+def time_to_depth(engine, fen, depth):
+    """Search a position to a fixed depth with a fresh table and return the SearchResult"""
+    engine.new_game()
+    return engine.search(ChessBoard.from_fen(fen), max_depth=depth)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.smp',
+        description='Measure the time to reach a fixed depth with one and several search processes '
+                    'and print one JSON object per line.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='worker counts to compare with one worker (default: 1 2 4)')
+    parser.add_argument('--depth', type=int, default=4, help='search depth (default: 4)')
+    parser.add_argument('--position', action='append', choices=[name for name, _ in BENCHMARK_POSITIONS],
+                        help='only run the named benchmark position, can be repeated')
+    parser.add_argument('--fen', help='run a custom position instead of the benchmark ones')
+    parser.add_argument('--table-bits', type=int, default=20,
+                        help='log2 of the number of transposition table entries (default: 20)')
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = [('fen', args.fen)]
+    else:
+        positions = [position for position in BENCHMARK_POSITIONS
+                     if not args.position or position[0] in args.position]
+    workers = sorted(set(args.workers) | {1})
+
+    # The worker processes are started before the clock runs and serve every position
+    engines = {1: Engine(table=TranspositionTable(args.table_bits))}
+    totals = dict.fromkeys(workers, 0.0)
+    try:
+        for count in workers[1:]:
+            engines[count] = ParallelEngine(count, table_bits=args.table_bits)
+            engines[count].start()
+        for name, fen in positions:
+            baseline = None
+            for count in workers:
+                result = time_to_depth(engines[count], fen, args.depth)
+                if count == 1:
+                    baseline = result.seconds
+                totals[count] += result.seconds
+                print(json.dumps({
+                    'position': name,
+                    'workers': count,
+                    'depth': result.depth,
+                    'move': convert_move_to_notation(result.move) if result.move else None,
+                    'score': result.score,
+                    'nodes': result.nodes,
+                    'seconds': round(result.seconds, 6),
+                    'nps': result.nps,
+                    'speedup': round(baseline / result.seconds, 3) if result.seconds else None,
+                }), flush=True)
+    finally:
+        for count in workers[1:]:
+            if count in engines:
+                engines[count].close()
+
+    for count in workers:
+        print(json.dumps({
+            'position': 'total',
+            'workers': count,
+            'seconds': round(totals[count], 6),
+            'speedup': round(totals[1] / totals[count], 3) if totals[count] else None,
+        }))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import io
+import os
+import pathlib
+import sys
+import tkinter as tk
+
+__all__ = ['load_sprites', 'cache_dir', 'asset_hash']
+
+PIECES_DIR = pathlib.Path(__file__).parent.resolve() / 'pieces'
+
+# Order of the sprites in the atlas, left to right
+SPRITES = [color + symbol for color in ('white', 'black') for symbol in 'KQRBNP']
+
+
+def cache_dir():
+    """Return the directory the scaled sprites are kept in, CHESS_CACHE_DIR when set"""
+    if os.environ.get('CHESS_CACHE_DIR'):
+        return pathlib.Path(os.environ['CHESS_CACHE_DIR'])
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or pathlib.Path.home() / 'AppData' / 'Local'
+    elif sys.platform == 'darwin':
+        base = pathlib.Path.home() / 'Library' / 'Caches'
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+    return pathlib.Path(base) / 'chess' / 'sprites'
+
+
+def source_path(sprite):
+    # wK.png for 'whiteK'
+    return PIECES_DIR / f"{sprite[0]}{sprite[-1]}.png"
+
+
+def asset_hash():
+    """Hash of the piece images, from their names, sizes and modification times so it costs no reading"""
+    digest = hashlib.sha1()
+    for sprite in SPRITES:
+        stat = source_path(sprite).stat()
+        digest.update(f"{sprite}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def build_atlas(size):
+    """Scale every piece image to size and return them side by side as PNG bytes, which needs Pillow"""
+    from PIL import Image
+    atlas = Image.new('RGBA', (size * len(SPRITES), size))
+    for index, sprite in enumerate(SPRITES):
+        with Image.open(source_path(sprite)) as image:
+            atlas.paste(image.resize((size, size)), (index * size, 0))
+    data = io.BytesIO()
+    atlas.save(data, format='PNG')
+    return data.getvalue()
+
+
+def load_sprites(size, master=None):
+    """Return a dict from color + symbol to a PhotoImage of the piece, size pixels square.
+
+    The scaled pieces are kept in one atlas image in the cache directory, keyed by size and
+    asset_hash, so after the first run they are read by Tk directly without Pillow or scaling.
+    """
+    path = cache_dir() / f"atlas-{size}-{asset_hash()}.png"
+    if path.exists():
+        atlas = tk.PhotoImage(master=master, file=str(path))
+    else:
+        data = build_atlas(size)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write next to the final name and rename, so a reader never sees half an atlas
+            temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+        except OSError:
+            pass  # Without a writable cache the pieces are scaled again on the next start
+        atlas = tk.PhotoImage(master=master, data=base64.b64encode(data))
+    sprites = {}
+    for index, sprite in enumerate(SPRITES):
+        image = tk.PhotoImage(master=master, width=size, height=size)
+        image.tk.call(image, 'copy', atlas, '-from', index * size, 0, (index + 1) * size, size)
+        sprites[sprite] = image
+    return sprites
@@ -0,0 +1,105 @@
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+__all__ = ['main']
+
+# Modules that only the GUI should bring in
+GUI_MODULES = ('tkinter', 'PIL')
+
+# Each scenario runs in a fresh interpreter: code run with -c, or arguments for python
+SCENARIOS = [
+    ('import chess', ['-c', 'import chess']),
+    ('import chess.chess_game', ['-c', 'import chess.chess_game']),
+    ('python -m chess --help', ['-m', 'chess', '--help']),
+]
+
+# Process start to the first frame of the window, which needs a display
+GUI_ARGUMENTS = ['-m', 'chess', '--first-frame']
+
+REPORT = ('import json, sys; print(json.dumps([module for module in {modules!r} if module in sys.modules]))')
+
+
+def worker_ready():
+    """Run in a spawned process: import what an engine worker needs and report the GUI modules loaded"""
+    from . import smp
+    smp.ChessBoard()
+    return [module for module in GUI_MODULES if module in sys.modules]
+
+
+def run_interpreter(arguments, cache=None):
+    """Return the seconds a fresh interpreter takes to run arguments, and the GUI modules it loaded.
+
+    With cache, the piece sprites are cached in that directory."""
+    if arguments[0] == '-c':
+        arguments = ['-c', arguments[1] + '; ' + REPORT.format(modules=GUI_MODULES)]
+    env = dict(os.environ, CHESS_CACHE_DIR=cache) if cache is not None else None
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable] + arguments, check=True, capture_output=True, text=True,
+                            env=env).stdout
+    seconds = time.perf_counter() - start
+    loaded = json.loads(output.splitlines()[-1]) if arguments[0] == '-c' else None
+    return seconds, loaded
+
+
+def run_first_frame(cache=None):
+    """Return the seconds from starting python -m chess to the first frame of its window,
+    with the sprites cached in cache or, by default, in a new empty directory"""
+    if cache is not None:
+        return run_interpreter(GUI_ARGUMENTS, cache)
+    with tempfile.TemporaryDirectory() as empty:
+        return run_interpreter(GUI_ARGUMENTS, empty)
+
+
+def run_worker():
+    """Return the seconds from starting a spawned worker process to its first result, and the GUI modules it loaded"""
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    with context.Pool(1) as pool:
+        loaded = pool.apply(worker_ready)
+        seconds = time.perf_counter() - start
+    return seconds, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.startup',
+        description='Measure the cold start of the package in fresh interpreters, spawned worker '
+                    'processes and optionally the window, and print one JSON object per scenario.')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each scenario (default: 5)')
+    parser.add_argument('--gui', action='store_true',
+                        help='also time the window up to its first frame, with a cold and a warm sprite cache')
+    args = parser.parse_args(argv)
+
+    scenarios = [(name, lambda arguments=arguments: run_interpreter(arguments)) for name, arguments in SCENARIOS]
+    scenarios.append(('spawned worker', run_worker))
+    warm = tempfile.TemporaryDirectory()
+    if args.gui:
+        run_first_frame(warm.name)
+        scenarios.append(('first frame, cold sprite cache', run_first_frame))
+        scenarios.append(('first frame, warm sprite cache', lambda: run_first_frame(warm.name)))
+    for name, run in scenarios:
+        times = []
+        for _ in range(args.repeat):
+            seconds, loaded = run()
+            times.append(seconds)
+        result = {
+            'scenario': name,
+            'median_seconds': round(statistics.median(times), 4),
+            'min_seconds': round(min(times), 4),
+        }
+        if loaded is not None:
+            result['gui_modules'] = loaded
+        print(json.dumps(result), flush=True)
+    warm.cleanup()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
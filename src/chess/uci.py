@@ -0,0 +1,208 @@
+import argparse
+import sys
+import threading
+
+from . import __version__
+from .chess_game import ChessBoard, STARTING_FEN, convert_move_to_notation, convert_notation_to_move
+from .engine import Engine, TranspositionTable, MATE_SCORE
+from .ordering import MAX_PLY
+
+__all__ = ['UCIProtocol', 'move_time', 'main']
+
+# Seconds kept back from every move for the time the moves take to reach the GUI
+MOVE_OVERHEAD = 0.05
+
+# Moves the remaining time is shared between when the GUI does not say
+DEFAULT_MOVES_TO_GO = 30
+
+# go arguments followed by a number
+GO_NUMBERS = ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime', 'depth', 'nodes')
+
+
+def move_time(limits, color):
+    """Return the seconds to think for the limits of a go command, or None without a clock"""
+    if 'movetime' in limits:
+        return max(limits['movetime'] / 1000 - MOVE_OVERHEAD, 0.01)
+    remaining = limits.get('wtime' if color == 'white' else 'btime')
+    if remaining is None:
+        return None
+    increment = limits.get('winc' if color == 'white' else 'binc', 0)
+    seconds = (remaining / limits.get('movestogo', DEFAULT_MOVES_TO_GO) + increment * 0.75) / 1000
+    # Never more than half of what is left
+    return max(min(seconds, remaining / 2000) - MOVE_OVERHEAD, 0.01)
+
+
+def format_score(score):
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        moves = (MATE_SCORE - abs(score) + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+class UCIProtocol:
+    """The engine side of the Universal Chess Interface, fed one command line at a time.
+
+    The board is kept between position commands: when the new moves extend the ones
+    already played only those are pushed, and when they differ only the moves after
+    the last common one are taken back, so a game costs one push per move. Searches
+    run in a thread, leaving the command loop free to answer isready and stop.
+    """
+
+    def __init__(self, engine=None, output=None):
+        self.engine = engine or Engine()
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.board = ChessBoard.from_fen(STARTING_FEN)
+        self.start_fen = STARTING_FEN
+        self.moves = []
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def handle(self, line):
+        """Answer a command line, returning False on quit"""
+        words = line.split()
+        if not words:
+            return True
+        command, arguments = words[0], words[1:]
+        if command == 'uci':
+            self.send(f"id name chess {__version__}")
+            self.send("id author ayaranitram")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'ucinewgame':
+            self.wait()
+            self.engine.new_game()
+            self.set_position(STARTING_FEN, [])
+        elif command == 'position':
+            self.wait()
+            self.position(arguments)
+        elif command == 'go':
+            self.wait()
+            self.go(arguments)
+        elif command == 'stop':
+            self.wait()
+        elif command == 'quit':
+            self.wait()
+            return False
+        elif command != 'debug' and command != 'setoption':
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def wait(self):
+        """Stop the search running, if any, and wait for its bestmove"""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def position(self, arguments):
+        if not arguments:
+            return
+        if 'moves' in arguments:
+            index = arguments.index('moves')
+            setup, moves = arguments[:index], arguments[index + 1:]
+        else:
+            setup, moves = arguments, []
+        if setup[0] == 'startpos':
+            fen = STARTING_FEN
+        elif setup[0] == 'fen':
+            fen = ' '.join(setup[1:])
+        else:
+            self.send(f"info string invalid position {' '.join(arguments)}")
+            return
+        self.set_position(fen, moves)
+
+    def set_position(self, fen, moves):
+        """Bring the board to the position after moves from fen, reusing the moves already played"""
+        if fen != self.start_fen:
+            try:
+                board = ChessBoard.from_fen(fen)
+            except (ValueError, IndexError, KeyError) as error:
+                self.send(f"info string invalid fen {fen}: {error}")
+                return
+            self.board, self.start_fen, self.moves = board, fen, []
+        common = 0
+        for played, move in zip(self.moves, moves):
+            if played != move:
+                break
+            common += 1
+        while len(self.moves) > common:
+            self.board.pop()
+            self.moves.pop()
+        for notation in moves[common:]:
+            try:
+                move = convert_notation_to_move(notation)
+            except ValueError:
+                move = None
+            if move not in self.board.cached_legal_moves():
+                self.send(f"info string illegal move {notation}")
+                return
+            self.board.push(move)
+            self.moves.append(notation)
+
+    def go(self, arguments):
+        limits = {}
+        infinite = False
+        for index, word in enumerate(arguments):
+            if word == 'infinite':
+                infinite = True
+            elif word in GO_NUMBERS and index + 1 < len(arguments):
+                try:
+                    limits[word] = int(arguments[index + 1])
+                except ValueError:
+                    pass
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.search, args=(limits, infinite), daemon=True)
+        self.thread.start()
+
+    def search(self, limits, infinite):
+        """Run in the search thread: search, report every depth and send bestmove"""
+        max_depth = limits.get('depth')
+        max_time = None if infinite else move_time(limits, self.board.current_player)
+        if infinite and not max_depth:
+            max_depth = MAX_PLY
+        result = self.engine.search(self.board, max_depth=max_depth, max_nodes=limits.get('nodes'),
+                                    max_time=max_time, callback=self.info, stop_event=self.stop_event)
+        if infinite:
+            # bestmove is only sent once the GUI says stop
+            self.stop_event.wait()
+        self.send(f"bestmove {convert_move_to_notation(result.move) if result.move else '0000'}")
+
+    def info(self, result):
+        pv = ' '.join(convert_move_to_notation(move) for move in result.pv)
+        self.send(f"info depth {result.depth} score {format_score(result.score)} nodes {result.nodes} "
+                  f"nps {result.nps} time {int(result.seconds * 1000)} pv {pv}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chess.uci',
+        description='Play as a UCI engine on standard input and output, for tournament managers and chess GUIs.')
+    parser.add_argument('--hash-bits', type=int, default=20,
+                        help='the transposition table holds 2**bits entries (default: 20)')
+    parser.add_argument('--book', help='Polyglot opening book (.bin) to play the first moves from')
+    parser.add_argument('--book-best', action='store_true',
+                        help='always play the most played book move instead of a weighted random one')
+    args = parser.parse_args(argv)
+
+    book = None
+    if args.book:
+        from .book import OpeningBook
+        book = OpeningBook(args.book)
+    protocol = UCIProtocol(Engine(table=TranspositionTable(args.hash_bits), book=book, book_best=args.book_best))
+    while True:
+        line = sys.stdin.readline()
+        if not line or not protocol.handle(line):
+            break
+    protocol.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())